@@ -0,0 +1,146 @@
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Callable
+
+from bppy import BEvent
+
+from debugger.server.break_point import Breakpoint, BreakpointRepository
+from debugger.server.event_registry import EventRegistry
+
+
+def _generate_predicate(event_names: List[str], depth: int) -> Dict[str, Any]:
+    if depth == 0 or random.random() < 0.3:
+        name = random.choice(("EVENT_SELECTED", "EVENT_SELECTED", "EVENT_REQUESTED", "EVENT_BLOCKED"))
+        return {"name": name, "value": random.choice(event_names)}
+    return {
+        "name": random.choice(("AND", "OR")),
+        "predicates": [_generate_predicate(event_names, depth - 1) for _ in range(random.randint(2, 4))],
+    }
+
+
+def _generate_breakpoints(count: int, events: int, depth: int, shared_subtrees: int) -> List[Dict[str, Any]]:
+    random.seed(0)
+    event_names = [f"EVENT_{i}" for i in range(events)]
+    # like generated breakpoint sets, the predicates can be composed from a few common subtrees
+    subtrees = [_generate_predicate(event_names, depth - 1) for _ in range(shared_subtrees)]
+
+    def generate() -> Dict[str, Any]:
+        if not subtrees:
+            return _generate_predicate(event_names, depth)
+        return {"name": random.choice(("AND", "OR")), "predicates": random.sample(subtrees, random.randint(2, 4))}
+
+    json_breakpoints = dict()
+    while len(json_breakpoints) < count:
+        json_breakpoint = {
+            "id": str(len(json_breakpoints)),
+            "chain": [generate() for _ in range(random.randint(1, 3))],
+        }
+        # a repository holds every chain only once
+        json_breakpoints.setdefault(Breakpoint.from_json(json_breakpoint).hash_chain(), json_breakpoint)
+    return list(json_breakpoints.values())
+
+
+class _OriginalPredicate:
+    # the predicates as they were before compilation, over the b-thread infos of a step
+    def __init__(self, json_predicate: Dict[str, Any]) -> None:
+        self.__name = json_predicate["name"]
+        self.__value = json_predicate.get("value")
+        self.__predicates = [_OriginalPredicate(p) for p in json_predicate.get("predicates", [])]
+
+    def attempt_solve(self, state: Dict[str, Any]) -> bool:
+        if self.__name == "AND":
+            return all([predicate.attempt_solve(state) for predicate in self.__predicates])
+        if self.__name == "OR":
+            return any([predicate.attempt_solve(state) for predicate in self.__predicates])
+        if self.__name == "EVENT_SELECTED":
+            return state["selected"] == self.__value
+        if self.__name == "EVENT_NUMBER":
+            return state["id"] == int(self.__value)
+        tag = "request" if self.__name == "EVENT_REQUESTED" else "block"
+        for info in state["b_thread_info"]:
+            if self.__value in info[tag]:
+                return True
+        return False
+
+
+def _generate_states(steps: int, events: int) -> List[Dict[str, Any]]:
+    random.seed(1)
+    registry = EventRegistry()
+    for i in range(events):
+        registry.intern(BEvent(f"EVENT_{i}"))
+    states = []
+    for step in range(steps):
+        requested_mask = sum(1 << i for i in random.sample(range(events), 8))
+        blocked_mask = sum(1 << i for i in random.sample(range(events), 3))
+        selected = random.choice(registry.ids(requested_mask & ~blocked_mask) or [0])
+        # one b-thread per requested event, the blocked events spread over the first ones
+        blocked_names = registry.names(blocked_mask)
+        b_thread_info = [
+            {"name": f"BThread-{i}", "request": [name], "wait_for": [], "block": blocked_names[i:i + 1]}
+            for i, name in enumerate(registry.names(requested_mask))
+        ]
+        states.append(
+            {
+                "selected": f"EVENT_{selected}",
+                "id": step,
+                "requested_mask": requested_mask,
+                "blocked_mask": blocked_mask,
+                "enabled_mask": requested_mask & ~blocked_mask,
+                "event_registry": registry,
+                "b_thread_info": b_thread_info,
+            }
+        )
+    return states
+
+
+def _per_step(advance: Callable[[Dict[str, Any]], Any], states: List[Dict[str, Any]]) -> float:
+    # the first pass compiles the predicates, only the second one is measured
+    for state in states:
+        advance(state)
+    start = time.perf_counter()
+    for state in states:
+        advance(state)
+    return (time.perf_counter() - start) / len(states) * 1e6
+
+
+def _measure_original(json_breakpoints: List[Dict[str, Any]], states: List[Dict[str, Any]]) -> float:
+    # the chains are walked like before, a single position each and the predicates interpreted
+    chains = [[_OriginalPredicate(p) for p in json_breakpoint["chain"]] for json_breakpoint in json_breakpoints]
+    positions = [0] * len(chains)
+
+    def advance(state: Dict[str, Any]) -> None:
+        for i, chain in enumerate(chains):
+            if chain[positions[i]].attempt_solve(state):
+                positions[i] += 1
+            else:
+                positions[i] = 1 if chain[0].attempt_solve(state) else 0
+            if positions[i] == len(chain):
+                positions[i] = 0
+    return _per_step(advance, states)
+
+
+def _measure_repository(json_breakpoints: List[Dict[str, Any]], states: List[Dict[str, Any]]) -> float:
+    repository = BreakpointRepository()
+    for json_breakpoint in json_breakpoints:
+        repository.add_breakpoint(Breakpoint.from_json(json_breakpoint))
+    return _per_step(repository.advance_break_points, states)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the per-step cost of evaluating many breakpoints")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=60)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--shared-subtrees", type=int, default=0)
+    arguments = parser.parse_args()
+
+    trace = _generate_states(arguments.steps, arguments.events)
+    print(f"{'breakpoints':>11} {'original us/step':>17} {'repository us/step':>19}")
+    for breakpoint_count in (100, 300, 1000, 3000):
+        breakpoints = _generate_breakpoints(
+            breakpoint_count, arguments.events, arguments.depth, arguments.shared_subtrees
+        )
+        original = _measure_original(breakpoints, trace)
+        repository = _measure_repository(breakpoints, trace)
+        print(f"{breakpoint_count:>11} {original:>17.1f} {repository:>19.1f}")
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+from typing import List, Tuple
+
+import requests
+from bppy import BProgram, BEvent, BProgramRunnerListener, PriorityBasedEventSelectionStrategy, sync, thread
+
+from debugger.server.listener import MonitoringListener
+
+
+class _SilentListener(BProgramRunnerListener):
+    def starting(self, b_program):
+        pass
+
+    def started(self, b_program):
+        pass
+
+    def super_step_done(self, b_program):
+        pass
+
+    def ended(self, b_program):
+        pass
+
+    def assertion_failed(self, b_program):
+        pass
+
+    def b_thread_added(self, b_program):
+        pass
+
+    def b_thread_removed(self, b_program):
+        pass
+
+    def b_thread_done(self, b_program):
+        pass
+
+    def halted(self, b_program):
+        pass
+
+    def event_selected(self, b_program, event):
+        pass
+
+
+@thread
+def _ping(steps: int):
+    for _ in range(steps):
+        yield sync(request=BEvent("PING"))
+
+
+async def _subscribe(port: int, connected: asyncio.Event, counter: List[int]) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /listen HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    counter[0] += 1
+    if counter[0] == counter[1]:
+        connected.set()
+    while True:
+        line = await reader.readline()
+        if not line or b'"ended": true' in line:
+            break
+    writer.close()
+
+
+async def _run_subscribers(port: int, subscribers: int, ready: threading.Event) -> None:
+    connected = asyncio.Event()
+    counter = [0, subscribers]
+    tasks = [asyncio.create_task(_subscribe(port, connected, counter)) for _ in range(subscribers)]
+    await connected.wait()
+    ready.set()
+    await asyncio.gather(*tasks)
+
+
+def _measure(asynchronous: bool, port: int, subscribers: int, steps: int) -> Tuple[float, int]:
+    # servers of earlier measurements keep running, only the threads started from here on are counted
+    baseline_threads = threading.active_count()
+    listener = MonitoringListener(_SilentListener(), f"benchmark-{port}", port=port, asynchronous=asynchronous)
+    b_program = BProgram(
+        bthreads=[listener.mark_name("Ping", _ping(steps))],
+        event_selection_strategy=PriorityBasedEventSelectionStrategy(),
+        listener=listener,
+    )
+    program_thread = threading.Thread(target=b_program.run, daemon=True)
+    program_thread.start()
+    time.sleep(1)
+    ready = threading.Event()
+    subscriber_thread = threading.Thread(
+        target=asyncio.run, args=(_run_subscribers(port, subscribers, ready),), daemon=True
+    )
+    subscriber_thread.start()
+    ready.wait()
+    # give the server time to register every subscriber before the program starts
+    time.sleep(1)
+    threads = threading.active_count() - baseline_threads
+    start = time.perf_counter()
+    requests.get(f"http://127.0.0.1:{port}/continue")
+    subscriber_thread.join()
+    return time.perf_counter() - start, threads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the threaded Flask transport with the asyncio transport")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--port", type=int, default=5100)
+    arguments = parser.parse_args()
+
+    print(f"{'transport':<10} {'subscribers':>11} {'seconds':>9} {'steps/s':>9} {'new threads':>12}")
+    port = arguments.port
+    for subscriber_count in arguments.subscribers:
+        for transport_name, is_asynchronous in (("flask", False), ("asyncio", True)):
+            seconds, thread_count = _measure(is_asynchronous, port, subscriber_count, arguments.steps)
+            print(
+                f"{transport_name:<10} {subscriber_count:>11} {seconds:>9.3f} "
+                f"{arguments.steps / seconds:>9.0f} {thread_count:>12}"
+            )
+            port += 1
+    # the flask development servers can not be shut down from the outside
+    os._exit(0)
@@ -0,0 +1,92 @@
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List, Callable, Tuple
+
+from debugger.trace.binary import BinaryEncoder, BinaryDecoder
+from debugger.trace.delta import DeltaEncoder, DeltaDecoder
+
+
+def _generate_frames(steps: int, b_threads: int, events: int) -> List[Dict[str, Any]]:
+    random.seed(0)
+    event_names = [f"EVENT_{i}" for i in range(events)]
+    sync_statements = [
+        {
+            "name": f"BThread-{b_thread}",
+            "priority": random.randint(0, 3),
+            "request": random.sample(event_names, 2),
+            "wait_for": random.sample(event_names, 5),
+            "block": random.sample(event_names, 3),
+        }
+        for b_thread in range(b_threads)
+    ]
+    frames = []
+    for step in range(steps):
+        # like in real programs, only a few b-threads change their sync statement per step
+        for _ in range(2):
+            changed = random.randrange(b_threads)
+            sync_statements[changed] = dict(sync_statements[changed], request=random.sample(event_names, 2))
+        frames.append(
+            {
+                "selected": random.choice(event_names),
+                "b_thread_info": list(sync_statements),
+                "parameters": {
+                    "Level": {"value": step % 100, "editable": False, "unit": "l"},
+                    "Temperature": {"value": round(random.uniform(0, 80), 3), "editable": False, "unit": "°C"},
+                },
+                "datetime": time.time(),
+                "id": step,
+                "type": "trace",
+            }
+        )
+    return frames
+
+
+def _json_codec() -> Tuple[Callable[[Dict[str, Any]], bytes], Callable[[bytes], List[Any]]]:
+    def encode(frame: Dict[str, Any]) -> bytes:
+        return f"data: {json.dumps(frame)}\n\n".encode()
+
+    def decode(data: bytes) -> List[Any]:
+        return [json.loads(data[6:])]
+    return encode, decode
+
+
+def _binary_codec() -> Tuple[Callable[[Dict[str, Any]], bytes], Callable[[bytes], List[Any]]]:
+    return BinaryEncoder().encode, BinaryDecoder().feed
+
+
+def _measure(frames: List[Dict[str, Any]], codec: Callable, delta: bool) -> Tuple[float, float, float]:
+    encode, decode = codec()
+    delta_encoder = DeltaEncoder()
+    delta_decoder = DeltaDecoder()
+    start = time.perf_counter()
+    encoded = [encode(delta_encoder.encode(frame) if delta else frame) for frame in frames]
+    encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for data in encoded:
+        for message in decode(data):
+            if delta:
+                delta_decoder.decode(message)
+    decode_seconds = time.perf_counter() - start
+    size = sum(len(data) for data in encoded)
+    return encode_seconds / len(frames) * 1e6, decode_seconds / len(frames) * 1e6, size / len(frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the JSON and the binary trace wire format")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--b-threads", type=int, default=40)
+    parser.add_argument("--events", type=int, default=60)
+    arguments = parser.parse_args()
+
+    trace = _generate_frames(arguments.steps, arguments.b_threads, arguments.events)
+    print(f"{'format':<14} {'encode us/frame':>16} {'decode us/frame':>16} {'bytes/frame':>12}")
+    for format_name, format_codec, use_delta in (
+            ("json", _json_codec, False),
+            ("binary", _binary_codec, False),
+            ("json+delta", _json_codec, True),
+            ("binary+delta", _binary_codec, True),
+    ):
+        encode_time, decode_time, frame_size = _measure(trace, format_codec, use_delta)
+        print(f"{format_name:<14} {encode_time:>16.1f} {decode_time:>16.1f} {frame_size:>12.0f}")
@@ -1,11 +1,22 @@
+import argparse
 import json
-from queue import Queue
-from threading import Thread, Lock
-from typing import List, Dict, Any
+from threading import Thread, Lock, Condition
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, Iterator, Callable
 
 import requests
 from flask import Flask, render_template, Response, request
 
+from debugger.client.backend.trace_store import MappedTraceStore, ColumnarTraceStore
+from debugger.server.async_transport import AsyncTransport, StreamNotifier
+from debugger.trace.binary import BinaryDecoder
+from debugger.trace.delta import DeltaDecoder
+from debugger.trace.recording import read_recording
+from debugger.trace.sync_statements import SyncStatementTable
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+EXPORT_CHUNK_SIZE = 1000
+
 
 def _format_sse(data: str, event=None) -> str:
     msg = f'data: {data}\n\n'
@@ -14,19 +25,102 @@ def _format_sse(data: str, event=None) -> str:
     return msg
 
 
+def _expand_event_set(
+        event_set: List[str] | Dict[str, Any],
+        events: List[str],
+        event_sets: Dict[str, List[int]],
+        event_sets_version: int,
+) -> Optional[List[str]]:
+    # returns None if the known events or event sets are not sufficient to expand the symbolic set
+    if isinstance(event_set, list):
+        return event_set
+    known = event_set["known"]
+    if len(events) < known:
+        return None
+    if event_set["symbol"] == "ALL":
+        return events[:known]
+    elif event_set["symbol"] == "ALL_EXCEPT":
+        excluded = set(event_set["except"])
+        return [events[event_id] for event_id in range(known) if event_id not in excluded]
+    else:
+        event_ids = event_sets.get(event_set["name"])
+        if event_ids is None or event_set.get("version", 0) > event_sets_version:
+            return None
+        return [events[event_id] for event_id in event_ids if event_id < known]
+
+
+class _StreamCursor:
+    """Position of a frontend consumer in the trace of the client.
+
+    Nothing is copied for a consumer, the trace states are read from the store once they are
+    due. Of the info frames only the latest one is delivered, after the states it follows.
+    """
+
+    def __init__(
+            self,
+            trace_store: MappedTraceStore | ColumnarTraceStore,
+            latest_info: Callable[[], Tuple[int, int, Optional[Dict[str, Any]]]],
+    ) -> None:
+        self.__trace_store = trace_store
+        self.__latest_info = latest_info
+        self.__next_id = 0
+        self.__info_version = 0
+
+    def pending(self) -> Iterator[Dict[str, Any]]:
+        info_version, info_last_id, info = self.__latest_info()
+        if info_version != self.__info_version:
+            yield from self.__states(info_last_id)
+            self.__info_version = info_version
+            yield info
+        yield from self.__states(None)
+
+    def __states(self, last_id: Optional[int]) -> Iterator[Dict[str, Any]]:
+        for state_id, state in self.__trace_store.items(self.__next_id):
+            if last_id is not None and state_id > last_id:
+                return
+            self.__next_id = state_id + 1
+            yield state
+
+
 class App:
-    def __init__(self) -> None:
+    def __init__(
+            self,
+            delta_encoding: bool = True,
+            asynchronous: bool = False,
+            batch_size: int = 100,
+            batch_interval: float = 20,
+            binary_format: bool = False,
+            trace_directory: Optional[str] = None,
+            columnar_store: bool = False,
+    ) -> None:
         self.__flask_app = Flask(__name__, static_url_path="/")
-
-        self.__backup_queue = Queue()
-        self.__consumer_queues: List[Queue] = []
-        self.__id_by_state: Dict[str, Dict[str, Any]] = dict()
-        self.__imported_id_by_state: Dict[str, Dict[str, Any]] = dict()
+        self.__delta_encoding = delta_encoding
+        self.__batch_size = batch_size
+        self.__batch_interval = batch_interval
+        self.__binary_format = binary_format
+        self.__asynchronous = asynchronous
+        self.__stream_notifier: Optional[StreamNotifier] = None
+        # counts the handled frames, threaded consumers wait for it to change
+        self.__frame_count = 0
+        self.__frame_condition = Condition()
+        # the latest info frame with its version and the id of the last state before it
+        self.__latest_info: Tuple[int, int, Optional[Dict[str, Any]]] = (0, -1, None)
+
+        self.__trace_store: MappedTraceStore | ColumnarTraceStore
+        if columnar_store:
+            self.__trace_store = ColumnarTraceStore()
+        else:
+            self.__trace_store = MappedTraceStore(trace_directory)
+        self.__imported_trace_store = ColumnarTraceStore()
+        self.__imported_payload: List[Dict[str, Any]] = []
         self.__timeout = 0
         self.__initial_parameters = dict()
         self.__running = False
+        self.__known_events: List[str] = []
+        self.__known_event_sets: Dict[str, List[int]] = dict()
+        self.__known_event_sets_version = 0
 
-        self.__backup_queue_lock = Lock()
+        self.__trace_store_lock = Lock()
 
         self.__json_breakpoints = {}
 
@@ -42,83 +136,119 @@ class App:
         self.__flask_app.route("/breakpoints/get")(self.__get_breakpoint)
         self.__flask_app.route("/breakpoints/pause/<b_id>")(self.__pause_breakpoint)
         self.__flask_app.route("/breakpoints/unpause/<b_id>")(self.__unpause_breakpoint)
+        self.__flask_app.route("/breakpoints/bulk/add", methods=["POST"])(self.__add_breakpoints)
+        self.__flask_app.route("/breakpoints/bulk/delete", methods=["POST"])(self.__delete_breakpoints)
+        self.__flask_app.route("/breakpoints/bulk/pause", methods=["POST"])(self.__pause_breakpoints)
+        self.__flask_app.route("/breakpoints/bulk/unpause", methods=["POST"])(self.__unpause_breakpoints)
         self.__flask_app.route("/breakpoints/enableStopIfDifferent")(self.__enable_stop_if_different)
         self.__flask_app.route("/breakpoints/disableStopIfDifferent")(self.__disable_stop_if_different)
         self.__flask_app.route("/setParameter/<parameter>/<new_value>")(self.__set_parameter)
         self.__flask_app.route("/download/<file_type>")(self.__download_model)
         self.__flask_app.route("/upload", methods=["POST"])(self.__upload_model)
+        self.__flask_app.route("/imported")(self.__get_imported)
 
-    def __create_queue_from_backup(self) -> Queue[Dict[str, Any]]:
-        self.__backup_queue_lock.acquire()
-        try:
-            consumer_queue = Queue()
-            to_re_add = []
-            while not self.__backup_queue.empty():
-                element = self.__backup_queue.get()
-                to_re_add.append(element)
-                consumer_queue.put(element)
-            self.__consumer_queues.append(consumer_queue)
-            for element_to_re_add in to_re_add:
-                self.__backup_queue.put(element_to_re_add)
-        finally:
-            self.__backup_queue_lock.release()
-        return consumer_queue
+    def __create_cursor(self) -> _StreamCursor:
+        # a new consumer first receives all earlier states, read from the store as it goes
+        return _StreamCursor(self.__trace_store, lambda: self.__latest_info)
 
     def __listen_to_server(self) -> None:
-        response = requests.get("http://127.0.0.1:5000/listen", stream=True, headers={'Accept': 'text/event-stream'})
-        for line in response.iter_lines(1, decode_unicode=True):
-            if line != "":
-                json_data = json.loads(line.split("data: ")[1])
-                if json_data["type"] == "trace":
-                    self.__id_by_state[str(json_data["id"])] = json_data
-                    self.__backup_queue_lock.acquire()
-                    try:
-                        self.__backup_queue.put(json_data)
-                    finally:
-                        self.__backup_queue_lock.release()
-                else:
-                    self.__running = not json_data["paused"]
-                to_remove = []
-                # fill consumer queues
-                for consumer_queue in self.__consumer_queues:
-                    # filter already full queues to be removed because not used anymore
-                    if consumer_queue.full():
-                        to_remove.append(consumer_queue)
-                    else:
-                        consumer_queue.put(json_data)
-                # remove unused consumer queues
-                for consumer_queue in to_remove:
-                    self.__consumer_queues.remove(consumer_queue)
+        arguments = {}
+        if self.__delta_encoding:
+            arguments["encoding"] = "delta"
+        if self.__batch_size > 1:
+            arguments["batch_size"] = self.__batch_size
+            arguments["batch_interval"] = self.__batch_interval
+        if self.__binary_format:
+            arguments["format"] = "binary"
+        delta_decoder = DeltaDecoder()
+        response = requests.get(
+            "http://127.0.0.1:5000/listen",
+            params=arguments,
+            stream=True,
+            headers={'Accept': 'application/octet-stream' if self.__binary_format else 'text/event-stream'},
+        )
+        if self.__binary_format:
+            binary_decoder = BinaryDecoder()
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                for message in binary_decoder.feed(chunk):
+                    self.__handle_server_message(message, delta_decoder)
+        else:
+            for line in response.iter_lines(STREAM_CHUNK_SIZE, decode_unicode=True):
+                if line != "":
+                    self.__handle_server_message(json.loads(line.split("data: ")[1]), delta_decoder)
+
+    def __handle_server_message(self, message: Dict[str, Any], delta_decoder: DeltaDecoder) -> None:
+        frames = message["frames"] if message["type"] == "batch" else [message]
+        for frame in frames:
+            self.__handle_server_frame(delta_decoder.decode(frame))
+
+    def __handle_server_frame(self, json_data: Dict[str, Any]) -> None:
+        if json_data["type"] == "trace":
+            self.__trace_store_lock.acquire()
+            try:
+                self.__trace_store.append(json_data["id"], json_data)
+            finally:
+                self.__trace_store_lock.release()
+        elif json_data["type"] == "info":
+            self.__running = not json_data["paused"]
+            last_id = self.__trace_store.last_id
+            self.__latest_info = (
+                self.__latest_info[0] + 1, last_id if last_id is not None else -1, json_data
+            )
+        with self.__frame_condition:
+            self.__frame_count += 1
+            self.__frame_condition.notify_all()
+        if self.__stream_notifier is not None:
+            self.__stream_notifier.notify()
+
+    def __initial_frame(self) -> Dict[str, Any]:
+        return {
+            "type": "initial",
+            "timeout": self.__timeout,
+            "parameters": self.__initial_parameters,
+            "running": self.__running,
+        }
+
+    @staticmethod
+    def __to_frontend_frame(data: Dict[str, Any]) -> Dict[str, Any]:
+        if data["type"] == "trace":
+            return {
+                "selected": data["selected"],
+                "parameters": data["parameters"],
+                "id": data["id"],
+                "type": data["type"],
+            }
+        return data
 
     def __client_listen(self) -> Response:
-        queue = self.__create_queue_from_backup()
+        cursor = self.__create_cursor()
 
         def stream():
-            yield _format_sse(
-                json.dumps(
-                    {
-                        "type": "initial",
-                        "timeout": self.__timeout,
-                        "parameters": self.__initial_parameters,
-                        "running": self.__running,
-                    }
-                )
-            )
+            yield _format_sse(json.dumps(self.__initial_frame()))
             while True:
-                data = queue.get()
-                if data["type"] == "trace":
-                    final_data = {
-                        "selected": data["selected"],
-                        "parameters": data["parameters"],
-                        "id": data["id"],
-                        "type": data["type"],
-                    }
-                else:
-                    final_data = data
-                yield _format_sse(json.dumps(final_data))
+                frame_count = self.__frame_count
+                for data in cursor.pending():
+                    yield _format_sse(json.dumps(self.__to_frontend_frame(data)))
+                with self.__frame_condition:
+                    self.__frame_condition.wait_for(lambda: self.__frame_count != frame_count)
 
         return Response(stream(), mimetype='text/event-stream', headers={"Access-Control-Allow-Origin": "*"})
 
+    def __async_client_listen(self, _: Dict[str, str]) -> Tuple[str, AsyncIterator[str]]:
+        return 'text/event-stream', self.__async_stream()
+
+    async def __async_stream(self) -> AsyncIterator[str]:
+        cursor = self.__create_cursor()
+        yield _format_sse(json.dumps(self.__initial_frame()))
+        while True:
+            delivered = False
+            for data in cursor.pending():
+                delivered = True
+                yield _format_sse(json.dumps(self.__to_frontend_frame(data)))
+            # wake ups while the consumer was suspended are lost, only a pass without frames may wait
+            if not delivered:
+                await self.__stream_notifier.wait()
+
     def __start(self) -> str:
         requests.get("http://127.0.0.1:5000/continue")
         self.__running = True
@@ -141,14 +271,50 @@ class App:
 
     def __get_state_data(self, data_type: str, state_id: str) -> Response:
         if data_type == "current":
-            complete_state_data = self.__id_by_state[state_id]
+            complete_state_data = self.__trace_store.get(int(state_id))
         else:
-            complete_state_data = self.__imported_id_by_state[state_id]
+            complete_state_data = self.__imported_trace_store.get(int(state_id))
+        b_thread_info = complete_state_data["b_thread_info"]
+        if b_thread_info is None:
+            b_thread_info = self.__fetch_b_thread_info([complete_state_data["id"]])[complete_state_data["id"]]
         return Response(
-            json.dumps(complete_state_data["b_thread_info"]),
+            json.dumps(self.__expand_b_thread_info(b_thread_info)),
             headers={"Access-Control-Allow-Origin": "*"},
         )
 
+    @staticmethod
+    def __fetch_b_thread_info(state_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        # a lazy server only expands the b-thread infos of a step once they are requested
+        response = requests.get(
+            "http://127.0.0.1:5000/stateData",
+            params={"ids": ",".join(str(state_id) for state_id in state_ids)},
+        ).json()
+        return {int(state_id): b_thread_info or [] for state_id, b_thread_info in response.items()}
+
+    def __expand_b_thread_info(self, b_thread_info: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        result = []
+        for info in b_thread_info:
+            expanded_info = dict(info)
+            for tag in ("request", "wait_for", "block"):
+                expanded = _expand_event_set(
+                    info[tag], self.__known_events, self.__known_event_sets, self.__known_event_sets_version
+                )
+                if expanded is None:
+                    # the server knows more events or larger event sets by now, fetching them once is sufficient
+                    self.__fetch_events()
+                    expanded = _expand_event_set(
+                        info[tag], self.__known_events, self.__known_event_sets, self.__known_event_sets_version
+                    )
+                expanded_info[tag] = expanded if expanded is not None else []
+            result.append(expanded_info)
+        return result
+
+    def __fetch_events(self) -> None:
+        response = requests.get("http://127.0.0.1:5000/events").json()
+        self.__known_events = response["events"]
+        self.__known_event_sets = response["event_sets"]
+        self.__known_event_sets_version = response["event_sets_version"]
+
     def __add_breakpoint(self) -> Response:
         json_breakpoint: dict = request.json
         self.__json_breakpoints[json_breakpoint["id"]] = json_breakpoint
@@ -167,30 +333,59 @@ class App:
         return Response(json.dumps(break_points), headers={"Access-Control-Allow-Origin": "*"})
 
     def __pause_breakpoint(self, b_id: str) -> Response:
-        self.__json_breakpoints[b_id]["paused"] = True
-        requests.get(f"http://127.0.0.1:5000/breakpoints/delete/{b_id}")
+        # the server keeps paused breakpoints, they do not have to be sent again on unpausing
+        self.__set_breakpoints_paused([b_id], True)
         return Response("", headers={"Access-Control-Allow-Origin": "*"})
 
     def __unpause_breakpoint(self, b_id: str) -> Response:
-        self.__json_breakpoints[b_id]["paused"] = False
-        json_breakpoint = self.__json_breakpoints[b_id]
-        requests.post("http://127.0.0.1:5000/breakpoints/add", json=json_breakpoint)
+        self.__set_breakpoints_paused([b_id], False)
+        return Response("", headers={"Access-Control-Allow-Origin": "*"})
+
+    def __add_breakpoints(self) -> Response:
+        json_breakpoints: List[dict] = request.json
+        for json_breakpoint in json_breakpoints:
+            self.__json_breakpoints[json_breakpoint["id"]] = json_breakpoint
+        requests.post("http://127.0.0.1:5000/breakpoints/bulk/add", json=json_breakpoints)
+        return Response("", headers={"Access-Control-Allow-Origin": "*"})
+
+    def __delete_breakpoints(self) -> Response:
+        b_ids: List[str] = request.json
+        for b_id in b_ids:
+            self.__json_breakpoints.pop(b_id, None)
+        requests.post("http://127.0.0.1:5000/breakpoints/bulk/delete", json=b_ids)
         return Response("", headers={"Access-Control-Allow-Origin": "*"})
 
+    def __pause_breakpoints(self) -> Response:
+        self.__set_breakpoints_paused(request.json, True)
+        return Response("", headers={"Access-Control-Allow-Origin": "*"})
+
+    def __unpause_breakpoints(self) -> Response:
+        self.__set_breakpoints_paused(request.json, False)
+        return Response("", headers={"Access-Control-Allow-Origin": "*"})
+
+    def __set_breakpoints_paused(self, b_ids: List[str], paused: bool) -> None:
+        # unknown ids are ignored, like the server does
+        b_ids = [b_id for b_id in b_ids if b_id in self.__json_breakpoints]
+        for b_id in b_ids:
+            self.__json_breakpoints[b_id]["paused"] = paused
+        action = "pause" if paused else "unpause"
+        requests.post(f"http://127.0.0.1:5000/breakpoints/bulk/{action}", json=b_ids)
+
     def __enable_stop_if_different(self) -> Response:
         current_position = 0
-        if len(self.__id_by_state) > 0:
-            current_position = int(list(self.__id_by_state.keys())[-1]) + 1
+        if self.__trace_store.last_id is not None:
+            current_position = self.__trace_store.last_id + 1
+        event_names = self.__imported_trace_store.event_names
         json_breakpoint = {
             "id": "0",
             "current_position": current_position,
             "chain": [
                 {
                     "name": "EVENT_SELECTED",
-                    "value": data["selected"],
+                    "value": event_names[event_id],
                     "kind": "flat",
                 }
-                for _, data in self.__imported_id_by_state.items()
+                for event_id in self.__imported_trace_store.selected
             ]
         }
         requests.post("http://127.0.0.1:5000/breakpoints/add", json=json_breakpoint)
@@ -212,8 +407,21 @@ class App:
 
     def __download_model(self, file_type: str) -> Response:
         if file_type == "json":
+            def export():
+                # streamed chunk by chunk, the trace is never held in memory as a whole
+                separator = "{"
+                for states in self.__chunked_states():
+                    pending = [state["id"] for state in states if state["b_thread_info"] is None]
+                    fetched = self.__fetch_b_thread_info(pending) if pending else dict()
+                    for state in states:
+                        b_thread_info = fetched.get(state["id"], state["b_thread_info"])
+                        exported = dict(state, b_thread_info=self.__expand_b_thread_info(b_thread_info))
+                        yield f'{separator}"{state["id"]}": {json.dumps(exported)}'
+                        separator = ", "
+                yield "{}" if separator == "{" else "}"
             return Response(
-                json.dumps(self.__id_by_state),
+                export(),
+                mimetype="application/json",
                 headers={"Access-Control-Allow-Origin": "*"}
             )
         else:
@@ -222,10 +430,33 @@ class App:
                 headers={"Access-Control-Allow-Origin": "*"}
             )
 
+    def __chunked_states(self) -> Iterator[List[Dict[str, Any]]]:
+        states = []
+        for state in self.__trace_store.values():
+            states.append(state)
+            if len(states) == EXPORT_CHUNK_SIZE:
+                yield states
+                states = []
+        if states:
+            yield states
+
     def __upload_model(self) -> Response:
-        self.__imported_id_by_state: Dict[int, Dict[str, Any]] = request.json
+        return Response(
+            json.dumps(self.import_model(request.json)),
+            headers={"Access-Control-Allow-Origin": "*"}
+        )
+
+    def __get_imported(self) -> Response:
+        # the frontend reads the imported trace on start-up, e.g. a recording loaded before it was opened
+        return Response(json.dumps(self.__imported_payload), headers={"Access-Control-Allow-Origin": "*"})
+
+    def import_model(self, id_by_state: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        imported_trace_store = ColumnarTraceStore()
+        for state in sorted(id_by_state.values(), key=lambda state: state["id"]):
+            imported_trace_store.append(state["id"], state)
+        self.__imported_trace_store = imported_trace_store
         payload = []
-        for _, value in self.__imported_id_by_state.items():
+        for _, value in id_by_state.items():
             payload.append(
                 {
                     "type": "trace",
@@ -234,22 +465,64 @@ class App:
                     "parameters": value["parameters"]
                 }
             )
-        return Response(
-            json.dumps(payload),
-            headers={"Access-Control-Allow-Origin": "*"}
-        )
+        self.__imported_payload = payload
+        return payload
+
+    def load_recording(self, directory: str) -> List[Dict[str, Any]]:
+        # imports a recording of the RecordingListener the same way as an uploaded download
+        events: List[str] = []
+        event_sets: Dict[str, List[int]] = dict()
+        event_sets_version = 0
+        sync_statement_table = SyncStatementTable()
+        id_by_state = dict()
+        for frame in read_recording(directory):
+            if frame["type"] == "events":
+                events = frame["events"]
+                event_sets = frame["event_sets"]
+                event_sets_version = frame["event_sets_version"]
+            elif frame["type"] == "sync_statements":
+                for statement_id, sync_statement in frame["definitions"].items():
+                    sync_statement_table.define(statement_id, sync_statement)
+            elif frame["type"] == "trace":
+                frame = sync_statement_table.rehydrate(frame)
+                b_thread_info = []
+                for info in frame["b_thread_info"]:
+                    expanded_info = dict(info)
+                    for tag in ("request", "wait_for", "block"):
+                        expanded_info[tag] = _expand_event_set(info[tag], events, event_sets, event_sets_version) or []
+                    b_thread_info.append(expanded_info)
+                id_by_state[str(frame["id"])] = dict(frame, b_thread_info=b_thread_info)
+        return self.import_model(id_by_state)
 
     def __connect_to_server(self) -> None:
         response = requests.get("http://127.0.0.1:5000/connect")
         self.__initial_parameters = response.json()
 
-    def run(self, port: int) -> None:
+    def run(self, port: int, offline: bool = False) -> None:
+        if offline:
+            # only serves imported traces, there is no b-program to connect to
+            self.__flask_app.run(port=port)
+            return
         self.__connect_to_server()
+        async_transport = None
+        if self.__asynchronous:
+            async_transport = AsyncTransport(self.__flask_app, port)
+            async_transport.stream_route("/listen", self.__async_client_listen)
+            self.__stream_notifier = async_transport.notifier()
         listener_thread = Thread(target=self.__listen_to_server)
         listener_thread.start()
-        self.__flask_app.run(port=port)
+        if async_transport is not None:
+            async_transport.run()
+        else:
+            self.__flask_app.run(port=port)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--recording", help="directory of a recording to import instead of connecting to a b-program")
+    arguments = parser.parse_args()
     app = App()
-    app.run(port=4000)
+    if arguments.recording is not None:
+        app.load_recording(arguments.recording)
+    app.run(port=arguments.port, offline=arguments.recording is not None)
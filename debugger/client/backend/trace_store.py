@@ -0,0 +1,399 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left, insort
+from threading import Lock
+from typing import Dict, Any, Optional, Iterator, Tuple, List
+
+from debugger.trace.sync_statements import SyncStatementTable
+
+# offset and length of a state in the data file, a length of 0 marks a missing state
+_index_entry = struct.Struct("<QQ")
+
+
+class _GrowingMap:
+    """Read-only memory map of a file that is only ever appended to, remapped once reads pass its end."""
+
+    def __init__(self, fd: int) -> None:
+        self.__fd = fd
+        self.__map: Optional[mmap.mmap] = None
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self.__map is None or offset + length > len(self.__map):
+            self.close()
+            self.__map = mmap.mmap(self.__fd, 0, access=mmap.ACCESS_READ)
+        return self.__map[offset:offset + length]
+
+    def close(self) -> None:
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+
+
+class MappedTraceStore:
+    """Stores the trace states of the client in memory mapped files instead of the heap.
+
+    States are appended as JSON to a data file, a second file holds a fixed-width entry per
+    state id pointing into it. Looking a state up therefore reads one index entry and the
+    state itself, independent of the length of the trace. The ids of the stored states are kept
+    in a compact sorted array, so iterating costs the number of states and not the highest id,
+    however sparse the ids are, e.g. of a sampled trace. The states reference the sync
+    statements of their b-threads, each distinct statement is kept once in memory. Without a
+    directory, both files are created in a temporary directory which is removed together with
+    the store.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.__temporary_directory = None
+        if directory is None:
+            self.__temporary_directory = tempfile.TemporaryDirectory(prefix="bp-debugger-")
+            directory = self.__temporary_directory.name
+        os.makedirs(directory, exist_ok=True)
+        self.__data_fd = os.open(os.path.join(directory, "states.data"), os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+        self.__index_fd = os.open(os.path.join(directory, "states.index"), os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+        self.__data_map = _GrowingMap(self.__data_fd)
+        self.__index_map = _GrowingMap(self.__index_fd)
+        self.__data_size = 0
+        self.__index_size = 0
+        self.__ids = array("q")
+        self.__sync_statement_table = SyncStatementTable()
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def __contains__(self, state_id: int) -> bool:
+        return self.get(state_id) is not None
+
+    @property
+    def last_id(self) -> Optional[int]:
+        return self.__ids[-1] if self.__ids else None
+
+    def append(self, state_id: int, state: Dict[str, Any]) -> None:
+        position = state_id * _index_entry.size
+        with self.__lock:
+            state, _ = self.__sync_statement_table.deduplicate(state)
+            data = json.dumps(state).encode()
+            is_new = position >= self.__index_size or not self.__stored_length(position)
+            os.pwrite(self.__data_fd, data, self.__data_size)
+            os.pwrite(self.__index_fd, _index_entry.pack(self.__data_size, len(data)), position)
+            self.__data_size += len(data)
+            self.__index_size = max(self.__index_size, position + _index_entry.size)
+            if is_new:
+                if not self.__ids or state_id > self.__ids[-1]:
+                    self.__ids.append(state_id)
+                else:
+                    insort(self.__ids, state_id)
+
+    def get(self, state_id: int) -> Optional[Dict[str, Any]]:
+        with self.__lock:
+            position = state_id * _index_entry.size
+            if state_id < 0 or position >= self.__index_size:
+                return None
+            offset, length = _index_entry.unpack(self.__index_map.read(position, _index_entry.size))
+            if not length:
+                return None
+            data = self.__data_map.read(offset, length)
+            return self.__sync_statement_table.rehydrate(json.loads(data))
+
+    def __stored_length(self, position: int) -> int:
+        return _index_entry.unpack(self.__index_map.read(position, _index_entry.size))[1]
+
+    def items(self, first_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        # in the order of the state ids, states appended while iterating are included
+        with self.__lock:
+            position = bisect_left(self.__ids, first_id)
+        while position < len(self.__ids):
+            state_id = self.__ids[position]
+            yield state_id, self.get(state_id)
+            position += 1
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        for _, state in self.items():
+            yield state
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__data_map.close()
+            self.__index_map.close()
+            os.close(self.__data_fd)
+            os.close(self.__index_fd)
+        if self.__temporary_directory is not None:
+            self.__temporary_directory.cleanup()
+
+
+_MISSING = object()
+
+
+class _Column:
+    """Values of one parameter from the row it first appeared in on.
+
+    The column starts out as a typed array chosen by its first value and falls back to a list
+    of objects once a value does not fit, e.g. because its type changed or it is missing.
+    """
+
+    def __init__(self, first_row: int, value: Any) -> None:
+        self.first_row = first_row
+        self.values: array | List[Any]
+        self.__strings: Optional[List[str]] = None
+        self.__string_ids: Dict[str, int] = dict()
+        value_type = type(value)
+        if value_type is bool:
+            self.values = array("b")
+        elif value_type is int:
+            self.values = array("q")
+        elif value_type is float:
+            self.values = array("d")
+        elif value_type is str:
+            # dictionary encoded
+            self.values = array("I")
+            self.__strings = []
+        else:
+            self.values = []
+
+    def append(self, value: Any) -> None:
+        if isinstance(self.values, list):
+            self.values.append(value)
+            return
+        try:
+            if self.__strings is not None:
+                self.values.append(self.__string_id(value))
+            elif type(value) is {"b": bool, "q": int, "d": float}[self.values.typecode]:
+                self.values.append(value)
+            else:
+                raise TypeError(value)
+        except (TypeError, OverflowError):
+            self.values = [self.__value(index) for index in range(len(self.values))]
+            self.values.append(value)
+
+    def pad(self, rows: int) -> None:
+        # marks the rows the parameter was not part of
+        while self.first_row + len(self.values) < rows:
+            if not isinstance(self.values, list):
+                self.values = [self.__value(index) for index in range(len(self.values))]
+            self.values.append(_MISSING)
+
+    def get(self, row: int) -> Any:
+        index = row - self.first_row
+        if index < 0 or index >= len(self.values):
+            return _MISSING
+        return self.__value(index)
+
+    def __value(self, index: int) -> Any:
+        value = self.values[index]
+        if self.__strings is not None and not isinstance(self.values, list):
+            return self.__strings[value]
+        if not isinstance(self.values, list) and self.values.typecode == "b":
+            return bool(value)
+        return value
+
+    def __string_id(self, value: Any) -> int:
+        if type(value) is not str:
+            raise TypeError(value)
+        string_id = self.__string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.__strings)
+            self.__strings.append(value)
+            self.__string_ids[value] = string_id
+        return string_id
+
+
+class ColumnarTraceStore:
+    """Stores the trace states of the client column by column.
+
+    The state ids, the selected events and the timestamps are kept in typed arrays, every
+    parameter gets a typed column of its own. Selected events, parameter metadata and the
+    sync statements of the b-threads are dictionary encoded, each distinct value is kept once
+    and the rows refer to it by its index. The explicit events of a sync statement are kept as a
+    bit mask over the event ids of the store, read back as names in the order of these ids.
+    States are rebuilt as dicts only when read.
+    """
+
+    def __init__(self) -> None:
+        self.__ids = array("q")
+        self.__timestamps = array("d")
+        self.__selected = array("I")
+        self.__event_names: List[str] = []
+        self.__event_ids: Dict[str, int] = dict()
+        self.__columns: Dict[str, _Column] = dict()
+        self.__parameter_metadata: List[Dict[str, Any]] = []
+        self.__parameter_metadata_ids: Dict[str, int] = dict()
+        self.__metadata_columns: Dict[str, _Column] = dict()
+        self.__sync_statements: List[Dict[str, Any]] = []
+        self.__sync_statement_ids: Dict[str, int] = dict()
+        self.__sync_statement_rows = array("I")
+        self.__sync_statement_offsets = array("Q", [0])
+        self.__extras_by_row: Dict[int, Dict[str, Any]] = dict()
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def __contains__(self, state_id: int) -> bool:
+        return self.__row(state_id) is not None
+
+    @property
+    def last_id(self) -> Optional[int]:
+        return self.__ids[-1] if self.__ids else None
+
+    @property
+    def ids(self) -> array:
+        return self.__ids
+
+    @property
+    def timestamps(self) -> array:
+        return self.__timestamps
+
+    @property
+    def event_names(self) -> List[str]:
+        return self.__event_names
+
+    @property
+    def selected(self) -> array:
+        # indices into event_names
+        return self.__selected
+
+    def parameter_names(self) -> List[str]:
+        return list(self.__columns)
+
+    def parameter_column(self, name: str) -> Tuple[int, array | List[Any]]:
+        # the first row of the parameter and its values from there on, rows without it hold None
+        column = self.__columns[name]
+        if isinstance(column.values, list):
+            return column.first_row, [None if value is _MISSING else value for value in column.values]
+        return column.first_row, column.values
+
+    def append(self, state_id: int, state: Dict[str, Any]) -> None:
+        with self.__lock:
+            if self.__ids and state_id <= self.__ids[-1]:
+                raise ValueError("States have to be appended in the order of their ids")
+            row = len(self.__ids)
+            self.__ids.append(state_id)
+            self.__timestamps.append(state.get("datetime", 0.0))
+            self.__selected.append(self.__event_id(state["selected"]))
+            for name, parameter in state.get("parameters", dict()).items():
+                metadata = dict(parameter)
+                value = metadata.pop("value", None)
+                self.__append_to_column(self.__columns, name, row, value)
+                self.__append_to_column(self.__metadata_columns, name, row, self.__metadata_id(metadata))
+            b_thread_info = state.get("b_thread_info", [])
+            for info in b_thread_info or []:
+                self.__sync_statement_rows.append(self.__sync_statement_id(info))
+            self.__sync_statement_offsets.append(len(self.__sync_statement_rows))
+            extras = {
+                key: value for key, value in state.items()
+                if key not in ("selected", "b_thread_info", "parameters", "datetime", "id", "type")
+            }
+            if b_thread_info is None:
+                # not expanded by a lazy listener yet
+                extras["b_thread_info"] = None
+            if extras:
+                self.__extras_by_row[row] = extras
+
+    def get(self, state_id: int) -> Optional[Dict[str, Any]]:
+        with self.__lock:
+            row = self.__row(state_id)
+            if row is None:
+                return None
+            return self.__state(row)
+
+    def items(self, first_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with self.__lock:
+            row = bisect_left(self.__ids, first_id)
+        while row < len(self.__ids):
+            with self.__lock:
+                state_id, state = self.__ids[row], self.__state(row)
+            yield state_id, state
+            row += 1
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        for _, state in self.items():
+            yield state
+
+    def close(self) -> None:
+        pass
+
+    def __row(self, state_id: int) -> Optional[int]:
+        row = bisect_left(self.__ids, state_id)
+        if row < len(self.__ids) and self.__ids[row] == state_id:
+            return row
+        return None
+
+    def __state(self, row: int) -> Dict[str, Any]:
+        parameters = dict()
+        for name, column in self.__columns.items():
+            value = column.get(row)
+            if value is not _MISSING:
+                metadata = self.__parameter_metadata[self.__metadata_columns[name].get(row)]
+                parameters[name] = {"value": value, **metadata}
+        start, end = self.__sync_statement_offsets[row], self.__sync_statement_offsets[row + 1]
+        state = {
+            "selected": self.__event_names[self.__selected[row]],
+            "b_thread_info": [
+                self.__from_masks(self.__sync_statements[i]) for i in self.__sync_statement_rows[start:end]
+            ],
+            "parameters": parameters,
+            "datetime": self.__timestamps[row],
+            "id": self.__ids[row],
+            "type": "trace",
+        }
+        state.update(self.__extras_by_row.get(row, dict()))
+        return state
+
+    @staticmethod
+    def __append_to_column(columns: Dict[str, _Column], name: str, row: int, value: Any) -> None:
+        column = columns.get(name)
+        if column is None:
+            column = columns[name] = _Column(row, value)
+        column.pad(row)
+        column.append(value)
+
+    def __event_id(self, name: str) -> int:
+        event_id = self.__event_ids.get(name)
+        if event_id is None:
+            event_id = self.__event_ids[name] = len(self.__event_names)
+            self.__event_names.append(name)
+        return event_id
+
+    def __metadata_id(self, metadata: Dict[str, Any]) -> int:
+        key = json.dumps(metadata, sort_keys=True)
+        metadata_id = self.__parameter_metadata_ids.get(key)
+        if metadata_id is None:
+            metadata_id = self.__parameter_metadata_ids[key] = len(self.__parameter_metadata)
+            self.__parameter_metadata.append(metadata)
+        return metadata_id
+
+    def __sync_statement_id(self, info: Dict[str, Any]) -> int:
+        key = json.dumps(info, sort_keys=True)
+        sync_statement_id = self.__sync_statement_ids.get(key)
+        if sync_statement_id is None:
+            sync_statement_id = self.__sync_statement_ids[key] = len(self.__sync_statements)
+            self.__sync_statements.append(self.__to_masks(info))
+        return sync_statement_id
+
+    def __to_masks(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        # symbolic event sets are kept as they are
+        stored = dict(info)
+        for tag in ("request", "wait_for", "block"):
+            if isinstance(info.get(tag), list):
+                mask = 0
+                for name in info[tag]:
+                    mask |= 1 << self.__event_id(name)
+                stored[tag] = mask
+        return stored
+
+    def __from_masks(self, stored: Dict[str, Any]) -> Dict[str, Any]:
+        info = dict(stored)
+        for tag in ("request", "wait_for", "block"):
+            mask = stored.get(tag)
+            if isinstance(mask, int):
+                names = []
+                while mask:
+                    lowest = mask & -mask
+                    names.append(self.__event_names[lowest.bit_length() - 1])
+                    mask ^= lowest
+                info[tag] = names
+        return info
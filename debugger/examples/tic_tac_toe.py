@@ -120,6 +120,7 @@ def player_x():  # simulate player X
 
 if __name__ == "__main__":
     listener = MonitoringListener(bp.PrintBProgramRunnerListener(), "tic_tac_toe")
+    listener.mark_event_set("MoveEvents", move_events)
     bprog = bp.BProgram(
         bthreads=
         [listener.mark_name(f"SquareTaken-{i}-{j}", square_taken(i, j)) for i in range(3) for j in range(3)] +
@@ -0,0 +1,149 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from typing import Dict, Callable, AsyncIterator, Optional, List, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+from flask import Flask
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+# a stream handler returns the content type of the stream and its chunks
+StreamHandler = Callable[[Dict[str, str]], Tuple[str, AsyncIterator[str | bytes]]]
+
+
+class StreamNotifier:
+    """Wakes up all coroutines waiting for new data, may be triggered from any thread."""
+
+    def __init__(self) -> None:
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__future: Optional[asyncio.Future] = None
+        self.__wake_scheduled = False
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.__loop = loop
+
+    def notify(self) -> None:
+        # one wake up per loop iteration is enough, no matter how many frames arrived in between
+        if self.__loop is None or self.__wake_scheduled:
+            return
+        self.__wake_scheduled = True
+        self.__loop.call_soon_threadsafe(self.__wake)
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        if self.__future is None:
+            self.__future = asyncio.get_running_loop().create_future()
+        # asyncio.wait does not cancel the shared future on a timeout
+        await asyncio.wait([self.__future], timeout=timeout)
+
+    def __wake(self) -> None:
+        self.__wake_scheduled = False
+        if self.__future is not None:
+            self.__future.set_result(None)
+            self.__future = None
+
+
+class AsyncTransport:
+    """Serves a Flask application on an asyncio event loop instead of one thread per connection.
+
+    Long-lived event streams are registered as coroutine routes and cost a coroutine per
+    subscriber. All other routes keep their Flask implementation and are handed to the WSGI
+    application on a small thread pool, so the URL surface stays the same.
+    """
+
+    def __init__(self, flask_app: Flask, port: int, host: str = "127.0.0.1", max_workers: int = 8) -> None:
+        self.__flask_app = flask_app
+        self.__port = port
+        self.__host = host
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__stream_routes: Dict[str, StreamHandler] = dict()
+        self.__notifiers: List[StreamNotifier] = []
+        self.__thread = Thread(target=self.run, daemon=True)
+
+    def stream_route(self, path: str, handler: StreamHandler) -> None:
+        self.__stream_routes[path] = handler
+
+    def notifier(self) -> StreamNotifier:
+        notifier = StreamNotifier()
+        self.__notifiers.append(notifier)
+        return notifier
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def run(self) -> None:
+        asyncio.run(self.__serve())
+
+    async def __serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        for notifier in self.__notifiers:
+            notifier.bind(loop)
+        server = await asyncio.start_server(self.__handle_connection, self.__host, self.__port)
+        async with server:
+            await server.serve_forever()
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+            if not request_line:
+                return
+            method, target, _ = request_line.split(" ", 2)
+            headers: List[Tuple[str, str]] = []
+            while True:
+                line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+                if not line:
+                    break
+                name, value = line.split(":", 1)
+                headers.append((name.strip(), value.strip()))
+            content_length = int(dict((name.lower(), value) for name, value in headers).get("content-length", 0))
+            body = await reader.readexactly(content_length) if content_length > 0 else b""
+            url = urlsplit(target)
+            handler = self.__stream_routes.get(url.path)
+            if handler is not None and method == "GET":
+                await self.__stream(writer, *handler(dict(parse_qsl(url.query))))
+            else:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    self.__executor, self.__call_flask, method, url.path, url.query, headers, body
+                )
+                writer.write(response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def __stream(writer: asyncio.StreamWriter, content_type: str, chunks: AsyncIterator[str | bytes]) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: %s\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Access-Control-Allow-Origin: *\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n" % content_type.encode("latin-1")
+        )
+        try:
+            # chunked encoding lets readers hand out every message as soon as it arrives
+            async for chunk in chunks:
+                data = chunk if isinstance(chunk, bytes) else chunk.encode()
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+        finally:
+            await chunks.aclose()
+
+    def __call_flask(self, method: str, path: str, query: str, headers: List[Tuple[str, str]], body: bytes) -> bytes:
+        builder = EnvironBuilder(path=path, method=method, query_string=query, headers=headers, data=body)
+        try:
+            app_iter, status, response_headers = run_wsgi_app(self.__flask_app.wsgi_app, builder.get_environ())
+            try:
+                content = b"".join(app_iter)
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+        finally:
+            builder.close()
+        head = [f"HTTP/1.1 {status}"]
+        head.extend(f"{name}: {value}" for name, value in response_headers if name.lower() != "content-length")
+        head.append(f"Content-Length: {len(content)}")
+        head.append("Connection: close")
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content
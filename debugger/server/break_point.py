@@ -1,5 +1,25 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Type, Tuple
+from threading import Lock
+from typing import Dict, Any, List, Type, Tuple, Callable, Optional, FrozenSet, Set
+
+
+def _bind(constants: Dict[str, Any], value: Any) -> str:
+    name = f"_c{len(constants)}"
+    constants[name] = value
+    return name
+
+
+def _compile_operand(predicate: "Predicate", constants: Dict[str, Any]) -> str:
+    expression = predicate.compile(constants)
+    if "_memo" not in constants or predicate.cost == 0:
+        return expression
+    predicate_hash = predicate.hash()
+    # only the results of predicates occurring more than once are shared for the step,
+    # the others are faster to evaluate again than to look up
+    if constants["_occurrences"].get(predicate_hash, 0) < 2:
+        return expression
+    key = _bind(constants, predicate_hash)
+    return f"(_memo[{key}] if {key} in _memo else _memo.setdefault({key}, {expression}))"
 
 
 class Predicate(ABC):
@@ -11,6 +31,24 @@ class Predicate(ABC):
     def attempt_solve(self, state: Dict[str, Any]) -> bool:
         pass
 
+    @property
+    def operands(self) -> Tuple["Predicate", ...]:
+        return tuple()
+
+    @property
+    def cost(self) -> int:
+        # 0 for predicates on the cheap keys of a step state, 1 for those that need its masks
+        return 1
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        # (state key, value) pairs of which a step has to match at least one to possibly solve the
+        # predicate, None if the predicate has to see every step
+        return None
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        # predicates without a compiled form are called as they are
+        return f"{_bind(constants, self)}.attempt_solve(state)"
+
     @classmethod
     def from_json(cls, json_predicate: Dict[str, str | List[Dict]]) -> "Predicate":
         pass
@@ -21,10 +59,31 @@ class AND(Predicate):
         self.__predicates = predicates
 
     def attempt_solve(self, state: Dict[str, Any]) -> bool:
-        return all([predicate.attempt_solve(state) for predicate in self.__predicates])
+        return all(predicate.attempt_solve(state) for predicate in self.__predicates)
+
+    @property
+    def operands(self) -> Tuple[Predicate, ...]:
+        return self.__predicates
+
+    @property
+    def cost(self) -> int:
+        return max((predicate.cost for predicate in self.__predicates), default=0)
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        # all operands have to be solved, so the keys of any of them are enough
+        candidates = [keys for keys in (predicate.dispatch_keys() for predicate in self.__predicates) if keys is not None]
+        return min(candidates, key=len, default=None)
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        if not self.__predicates:
+            return "True"
+        # the operands are independent of each other, so the cheap ones are tested first
+        operands = sorted(self.__predicates, key=lambda predicate: predicate.cost)
+        return "(" + " and ".join(_compile_operand(predicate, constants) for predicate in operands) + ")"
 
     def hash(self) -> str:
-        return "-AND-".join(sorted([predicate.hash() for predicate in self.__predicates]))
+        # parenthesized, so nested ANDs and ORs can not end up with the same hash
+        return "(" + "-AND-".join(sorted([predicate.hash() for predicate in self.__predicates])) + ")"
 
     @classmethod
     def from_json(cls, json_predicate: Dict[str, str | List[Dict]]) -> "Predicate":
@@ -40,10 +99,35 @@ class OR(Predicate):
         self.__predicates = predicates
 
     def attempt_solve(self, state: Dict[str, Any]) -> bool:
-        return any([predicate.attempt_solve(state) for predicate in self.__predicates])
+        return any(predicate.attempt_solve(state) for predicate in self.__predicates)
+
+    @property
+    def operands(self) -> Tuple[Predicate, ...]:
+        return self.__predicates
+
+    @property
+    def cost(self) -> int:
+        return max((predicate.cost for predicate in self.__predicates), default=0)
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        keys = frozenset()
+        for predicate in self.__predicates:
+            predicate_keys = predicate.dispatch_keys()
+            if predicate_keys is None:
+                return None
+            keys |= predicate_keys
+        return keys
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        if not self.__predicates:
+            return "False"
+        # the operands are independent of each other, so the cheap ones are tested first
+        operands = sorted(self.__predicates, key=lambda predicate: predicate.cost)
+        return "(" + " or ".join(_compile_operand(predicate, constants) for predicate in operands) + ")"
 
     def hash(self) -> str:
-        return "-OR-".join(sorted([predicate.hash() for predicate in self.__predicates]))
+        # parenthesized, so nested ANDs and ORs can not end up with the same hash
+        return "(" + "-OR-".join(sorted([predicate.hash() for predicate in self.__predicates])) + ")"
 
     @classmethod
     def from_json(cls, json_predicate: Dict[str, str | List[Dict]]) -> "Predicate":
@@ -61,6 +145,16 @@ class EventSelected(Predicate):
     def attempt_solve(self, state: Dict[str, Any]) -> bool:
         return state["selected"] == self.__event
 
+    @property
+    def cost(self) -> int:
+        return 0
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        return f'state["selected"] == {_bind(constants, self.__event)}'
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        return frozenset({("selected", self.__event)})
+
     def hash(self) -> str:
         return f"SELECTED:{self.__event}"
 
@@ -74,11 +168,13 @@ class EventRequested(Predicate):
         self.__event = event
 
     def attempt_solve(self, state: Dict[str, Any]) -> bool:
-        info: Dict[str, List[str]]
-        for info in state["b_thread_info"]:
-            if self.__event in info["request"]:
-                return True
-        return False
+        return bool(state["requested_mask"] & state["event_registry"].name_mask(self.__event))
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        return f'(state["requested_mask"] & state["event_registry"].name_mask({_bind(constants, self.__event)}) != 0)'
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        return frozenset({("requested", self.__event)})
 
     def hash(self) -> str:
         return f"REQUESTED:{self.__event}"
@@ -93,11 +189,13 @@ class EventBlocked(Predicate):
         self.__event = event
 
     def attempt_solve(self, state: Dict[str, Any]) -> bool:
-        info: Dict[str, List[str]]
-        for info in state["b_thread_info"]:
-            if self.__event in info["block"]:
-                return True
-        return False
+        return bool(state["blocked_mask"] & state["event_registry"].name_mask(self.__event))
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        return f'(state["blocked_mask"] & state["event_registry"].name_mask({_bind(constants, self.__event)}) != 0)'
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        return frozenset({("blocked", self.__event)})
 
     def hash(self) -> str:
         return f"BLOCKED:{self.__event}"
@@ -116,6 +214,16 @@ class EventNumber(Predicate):
             return True
         return False
 
+    @property
+    def cost(self) -> int:
+        return 0
+
+    def compile(self, constants: Dict[str, Any]) -> str:
+        return f'state["id"] == {_bind(constants, self.__number)}'
+
+    def dispatch_keys(self) -> Optional[FrozenSet[Tuple[str, Any]]]:
+        return frozenset({("id", self.__number)})
+
     def hash(self) -> str:
         return f"NUMBER:{self.__number}"
 
@@ -124,6 +232,64 @@ class EventNumber(Predicate):
         return cls(int(json_predicate["value"]))
 
 
+def compile_predicate(
+        predicate: Predicate,
+        memo: Optional[Dict[str, bool]] = None,
+        occurrences: Optional[Dict[str, int]] = None,
+) -> Callable[[Dict[str, Any]], bool]:
+    # a whole predicate tree becomes a single short-circuiting expression over the step state,
+    # the values it compares against are bound as constants, no user input ends up in the source
+    constants: Dict[str, Any] = dict()
+    if memo is not None:
+        constants["_memo"] = memo
+        constants["_occurrences"] = occurrences if occurrences is not None else dict()
+    expression = _compile_operand(predicate, constants)
+    return eval(f"lambda state: bool({expression})", constants)
+
+
+class PredicateTable:
+    # evaluators by predicate hash, predicates occurring more than once share their result per step
+
+    def __init__(self) -> None:
+        self.__memo: Dict[str, bool] = dict()
+        self.__occurrences: Dict[str, int] = dict()
+        self.__evaluator_by_hash: Dict[str, Callable[[Dict[str, Any]], bool]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.__occurrences)
+
+    def add(self, predicate: Predicate) -> None:
+        for operand in predicate.operands:
+            self.add(operand)
+        predicate_hash = predicate.hash()
+        occurrences = self.__occurrences.get(predicate_hash, 0) + 1
+        self.__occurrences[predicate_hash] = occurrences
+        if occurrences == 2:
+            # the evaluators compiled so far do not share the results of this predicate yet
+            self.__evaluator_by_hash.clear()
+
+    def remove(self, predicate: Predicate) -> None:
+        for operand in predicate.operands:
+            self.remove(operand)
+        predicate_hash = predicate.hash()
+        occurrences = self.__occurrences[predicate_hash] - 1
+        if occurrences == 0:
+            self.__occurrences.pop(predicate_hash)
+            self.__evaluator_by_hash.pop(predicate_hash, None)
+        else:
+            self.__occurrences[predicate_hash] = occurrences
+
+    def evaluator(self, predicate_hash: str, predicate: Predicate) -> Callable[[Dict[str, Any]], bool]:
+        evaluator = self.__evaluator_by_hash.get(predicate_hash)
+        if evaluator is None:
+            evaluator = compile_predicate(predicate, self.__memo, self.__occurrences)
+            self.__evaluator_by_hash[predicate_hash] = evaluator
+        return evaluator
+
+    def begin_step(self) -> None:
+        self.__memo.clear()
+
+
 POSSIBLE_PREDICATES: Dict[str, Type[Predicate]] = {
     "EVENT_SELECTED": EventSelected,
     "EVENT_REQUESTED": EventRequested,
@@ -135,10 +301,13 @@ POSSIBLE_PREDICATES: Dict[str, Type[Predicate]] = {
 
 
 class Breakpoint:
-    def __init__(self, b_id: str, *chain: Predicate) -> None:
+    def __init__(self, b_id: str, *chain: Predicate, pausing: bool = True) -> None:
         self.__chain = chain
-        self.__current_position = 0
+        # compiled on first use, so the long chains of difference breakpoints are not compiled up front
+        self.__evaluators: List[Optional[Callable[[Dict[str, Any]], bool]]] = [None] * len(chain)
         self.__b_id = b_id
+        # a breakpoint that does not pause the b-program only triggers the capture window
+        self.__pausing = pausing
 
     @classmethod
     def from_json(cls, json_breakpoint: Dict[str, str | List[Dict]]) -> "Breakpoint":
@@ -149,30 +318,25 @@ class Breakpoint:
             if possible_predicate_type is None:
                 raise ValueError(f"Predicate '{name}' not known")
             predicates.append(possible_predicate_type.from_json(predicate))
-        return cls(json_breakpoint["id"], *predicates)
+        return cls(json_breakpoint["id"], *predicates, pausing=json_breakpoint.get("pausing", True))
 
     @property
     def b_id(self) -> str:
         return self.__b_id
 
-    def advance(self, state: Dict[str, Any]) -> bool:
-        predicate = self.__chain[self.__current_position]
-        if predicate.attempt_solve(state):
-            self.__current_position += 1
-        else:
-            self.reset()
-            # check if the current state would solve the first predicate,
-            # after it was not able to solve the previous one
-            first_predicate = self.__chain[self.__current_position]
-            if first_predicate.attempt_solve(state):
-                self.__current_position += 1
-        if self.__current_position == len(self.__chain):
-            self.reset()
-            return True
-        return False
+    @property
+    def pausing(self) -> bool:
+        return self.__pausing
+
+    @property
+    def chain(self) -> Tuple[Predicate, ...]:
+        return self.__chain
 
-    def reset(self) -> None:
-        self.__current_position = 0
+    def evaluate(self, position: int, state: Dict[str, Any]) -> bool:
+        evaluator = self.__evaluators[position]
+        if evaluator is None:
+            evaluator = self.__evaluators[position] = compile_predicate(self.__chain[position])
+        return evaluator(state)
 
     def hash_chain(self) -> str:
         return "--".join([predicate.hash() for predicate in self.__chain])
@@ -187,9 +351,9 @@ class DifferenceBreakpoint(Breakpoint):
 
     def advance(self, state: Dict[str, Any]) -> bool:
         if self.__current_position < len(self.__chain):
-            predicate = self.__chain[self.__current_position]
+            position = self.__current_position
             self.__current_position += 1
-            if predicate.attempt_solve(state):
+            if self.evaluate(position, state):
                 return False
             else:
                 return True
@@ -208,38 +372,201 @@ class DifferenceBreakpoint(Breakpoint):
         return cls(json_breakpoint["id"], int(json_breakpoint["current_position"]), *predicates)
 
 
+class _ChainNode:
+    # prefix of one or more chains, the breakpoints are those whose chain ends here
+
+    def __init__(
+            self,
+            parent: Optional["_ChainNode"],
+            predicate: Optional[Predicate],
+            predicate_table: Optional[PredicateTable] = None,
+    ) -> None:
+        self.parent = parent
+        self.predicate = predicate
+        self.predicate_hash = predicate.hash() if predicate is not None else None
+        self.children: Dict[str, _ChainNode] = dict()
+        self.breakpoints: List[Breakpoint] = []
+        self.removed = False
+        self.__predicate_table = predicate_table
+
+    def evaluate(self, state: Dict[str, Any]) -> bool:
+        return self.__predicate_table.evaluator(self.predicate_hash, self.predicate)(state)
+
+
 class BreakpointRepository:
+    # all chains share one trie of their predicates, every prefix solved by the latest steps
+    # stays active, so overlapping matches are found; paused breakpoints are kept out of it
+
     def __init__(self) -> None:
+        self.__lock = Lock()
         self.__breakpoints_by_chain: Dict[str, Breakpoint] = dict()
-        self.__fired_by_breakpoint: Dict[Breakpoint, bool] = dict()
+        self.__breakpoints_by_id: Dict[str, Breakpoint] = dict()
+        self.__paused_ids: Set[str] = set()
+        self.__fired: List[Breakpoint] = []
+        self.__predicate_table = PredicateTable()
+        self.__root = _ChainNode(None, None)
+        self.__active_nodes: List[_ChainNode] = []
+        self.__node_by_breakpoint: Dict[Breakpoint, _ChainNode] = dict()
+        self.__difference_breakpoints: List[DifferenceBreakpoint] = []
+        self.__every_step: Set[_ChainNode] = set()
+        self.__first_nodes_by_key: Dict[str, Dict[Any, Set[_ChainNode]]] = {
+            "selected": dict(), "requested": dict(), "blocked": dict(), "id": dict()
+        }
+
+    def __index(self, node: _ChainNode) -> None:
+        keys = node.predicate.dispatch_keys()
+        if keys is None:
+            self.__every_step.add(node)
+            return
+        for state_key, value in keys:
+            self.__first_nodes_by_key[state_key].setdefault(value, set()).add(node)
+
+    def __unindex(self, node: _ChainNode) -> None:
+        keys = node.predicate.dispatch_keys()
+        if keys is None:
+            self.__every_step.discard(node)
+            return
+        for state_key, value in keys:
+            nodes = self.__first_nodes_by_key[state_key][value]
+            nodes.discard(node)
+            if not nodes:
+                self.__first_nodes_by_key[state_key].pop(value)
+
+    def __len__(self) -> int:
+        # only the active breakpoints, paused ones can not fire
+        return len(self.__breakpoints_by_id) - len(self.__paused_ids)
 
     def add_breakpoint(self, break_point: Breakpoint) -> None:
-        chain_hash = break_point.hash_chain()
-        if chain_hash in self.__breakpoints_by_chain:
-            raise KeyError(f"Breakpoint with hash '{chain_hash}' already exists")
-        self.__breakpoints_by_chain[chain_hash] = break_point
-        self.__fired_by_breakpoint[break_point] = False
+        self.add_breakpoints([break_point])
+
+    def add_breakpoints(self, break_points: List[Breakpoint], paused_ids: Optional[Set[str]] = None) -> None:
+        # the breakpoints of paused_ids are added in their paused state
+        paused_ids = paused_ids or set()
+        chain_hashes = [break_point.hash_chain() for break_point in break_points]
+        with self.__lock:
+            # either all breakpoints are added or none
+            new_ids = set()
+            new_chain_hashes = set()
+            for break_point, chain_hash in zip(break_points, chain_hashes):
+                if chain_hash in self.__breakpoints_by_chain or chain_hash in new_chain_hashes:
+                    raise KeyError(f"Breakpoint with hash '{chain_hash}' already exists")
+                if break_point.b_id in self.__breakpoints_by_id or break_point.b_id in new_ids:
+                    raise KeyError(f"Breakpoint with id '{break_point.b_id}' already exists")
+                new_chain_hashes.add(chain_hash)
+                new_ids.add(break_point.b_id)
+            for break_point, chain_hash in zip(break_points, chain_hashes):
+                self.__breakpoints_by_chain[chain_hash] = break_point
+                self.__breakpoints_by_id[break_point.b_id] = break_point
+                if break_point.b_id in paused_ids:
+                    self.__paused_ids.add(break_point.b_id)
+                else:
+                    self.__insert(break_point)
 
     def delete_breakpoint(self, b_id: str) -> None:
-        for chain_hash, break_point in self.__breakpoints_by_chain.items():
-            if break_point.b_id == b_id:
-                self.__breakpoints_by_chain.pop(chain_hash)
-                self.__fired_by_breakpoint.pop(break_point)
-                break
+        self.delete_breakpoints([b_id])
+
+    def delete_breakpoints(self, b_ids: List[str]) -> None:
+        # unknown ids are ignored
+        with self.__lock:
+            for b_id in b_ids:
+                break_point = self.__breakpoints_by_id.pop(b_id, None)
+                if break_point is None:
+                    continue
+                self.__breakpoints_by_chain.pop(break_point.hash_chain())
+                if b_id in self.__paused_ids:
+                    self.__paused_ids.remove(b_id)
+                else:
+                    self.__remove(break_point)
+            self.__forget_removed()
+
+    def pause_breakpoints(self, b_ids: List[str]) -> None:
+        with self.__lock:
+            for b_id in b_ids:
+                if b_id in self.__breakpoints_by_id and b_id not in self.__paused_ids:
+                    self.__paused_ids.add(b_id)
+                    self.__remove(self.__breakpoints_by_id[b_id])
+            self.__forget_removed()
+
+    def unpause_breakpoints(self, b_ids: List[str]) -> None:
+        with self.__lock:
+            for b_id in b_ids:
+                if b_id in self.__paused_ids:
+                    self.__paused_ids.remove(b_id)
+                    self.__insert(self.__breakpoints_by_id[b_id])
+
+    def __insert(self, break_point: Breakpoint) -> None:
+        if isinstance(break_point, DifferenceBreakpoint):
+            self.__difference_breakpoints.append(break_point)
+            return
+        node = self.__root
+        for predicate in break_point.chain:
+            child = node.children.get(predicate.hash())
+            if child is None:
+                child = node.children[predicate.hash()] = _ChainNode(node, predicate, self.__predicate_table)
+                self.__predicate_table.add(predicate)
+                if node is self.__root:
+                    self.__index(child)
+            node = child
+        node.breakpoints.append(break_point)
+        self.__node_by_breakpoint[break_point] = node
+
+    def __remove(self, break_point: Breakpoint) -> None:
+        # replaced instead of changed, the fired breakpoints might be read at the same time
+        self.__fired = [fired for fired in self.__fired if fired is not break_point]
+        if isinstance(break_point, DifferenceBreakpoint):
+            self.__difference_breakpoints.remove(break_point)
+            return
+        node = self.__node_by_breakpoint.pop(break_point)
+        node.breakpoints.remove(break_point)
+        # prune the nodes no other chain goes through
+        while node is not self.__root and not node.breakpoints and not node.children:
+            node.parent.children.pop(node.predicate_hash)
+            node.removed = True
+            self.__predicate_table.remove(node.predicate)
+            if node.parent is self.__root:
+                self.__unindex(node)
+            node = node.parent
+
+    def __forget_removed(self) -> None:
+        self.__active_nodes = [active_node for active_node in self.__active_nodes if not active_node.removed]
+
+    def __first_nodes(self, state: Dict[str, Any]) -> Set[_ChainNode]:
+        nodes = set(self.__every_step)
+        for state_key in ("selected", "id"):
+            nodes.update(self.__first_nodes_by_key[state_key].get(state[state_key], ()))
+        for state_key in ("requested", "blocked"):
+            nodes_by_name = self.__first_nodes_by_key[state_key]
+            # the masks are only derived for steps if some chain needs them
+            if nodes_by_name:
+                for name in set(state["event_registry"].names(state[f"{state_key}_mask"])):
+                    nodes.update(nodes_by_name.get(name, ()))
+        return nodes
 
     def advance_break_points(self, state: Dict[str, Any]) -> bool:
-        all_state = []
-        for break_point in self.__breakpoints_by_chain.values():
-            fired = break_point.advance(state)
-            self.__fired_by_breakpoint[break_point] = fired
-            all_state.append(fired)
-        if True in all_state:
-            return True
-        return False
+        with self.__lock:
+            return self.__advance(state)
+
+    def __advance(self, state: Dict[str, Any]) -> bool:
+        self.__fired = []
+        self.__predicate_table.begin_step()
+        active_nodes = []
+        # a node has a single parent, so it is reached at most once per step
+        for node in (
+                *(child for active_node in self.__active_nodes for child in active_node.children.values()),
+                *self.__first_nodes(state),
+        ):
+            if node.evaluate(state):
+                self.__fired.extend(node.breakpoints)
+                if node.children:
+                    active_nodes.append(node)
+        self.__active_nodes = active_nodes
+        for break_point in self.__difference_breakpoints:
+            if break_point.advance(state):
+                self.__fired.append(break_point)
+        return len(self.__fired) > 0
 
     def which(self) -> Tuple[str, ...]:
-        result = []
-        for b, fired in self.__fired_by_breakpoint.items():
-            if fired:
-                result.append(b.b_id)
-        return tuple(result)
+        return tuple(break_point.b_id for break_point in self.__fired)
+
+    def pausing_fired(self) -> bool:
+        return any(break_point.pausing for break_point in self.__fired)
@@ -0,0 +1,44 @@
+from collections import deque
+from typing import Dict, Any, Deque, List
+
+
+class CaptureWindow:
+    """Only lets the steps around a trigger pass, like the trigger of an oscilloscope.
+
+    The latest pre-trigger steps are kept in a ring. A trigger frame follows the step that fired
+    it, so the ring holds one step more: once a trigger arrives, its own step and the steps
+    before it are flushed ahead of it and the next post-trigger steps pass as well, a trigger
+    within that window extends it. Everything that is not a step, e.g. info frames, always passes.
+    Steps are matched to the triggers by their step_id.
+    """
+
+    def __init__(self, pre_trigger: int, post_trigger: int) -> None:
+        if pre_trigger < 0 or post_trigger < 0:
+            raise ValueError("The size of a capture window can not be negative")
+        self.__pre_trigger = pre_trigger
+        self.__post_trigger = post_trigger
+        self.__ring: Deque[Any] = deque(maxlen=pre_trigger + 1)
+        self.__remaining = 0
+
+    def admit(self, item: Any, is_step: bool) -> List[Any]:
+        # returns the items to pass on in their order
+        if is_step:
+            if self.__remaining > 0:
+                self.__remaining -= 1
+                return [item]
+            self.__ring.append(item)
+            return []
+        if isinstance(item, dict) and item.get("type") == "trigger":
+            result = list(self.__ring)
+            self.__ring.clear()
+            if not result or result[-1].step_id != item["id"]:
+                # the firing step passed already or was never submitted, e.g. sampled out
+                result = result[max(len(result) - self.__pre_trigger, 0):]
+            result.append(item)
+            self.__remaining = self.__post_trigger
+            return result
+        return [item]
+
+    @staticmethod
+    def trigger_frame(step_id: int, breakpoint_ids: List[str]) -> Dict[str, Any]:
+        return {"type": "trigger", "id": step_id, "breakpoint_ids": breakpoint_ids}
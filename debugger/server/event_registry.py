@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, NamedTuple
+
+from bppy import BEvent, EventSetList, EventSet, All, EmptyEventSet
+
+
+class EventRegistry:
+    """Append-only universe of all events the listener has seen so far.
+
+    Every event is interned once and keeps its integer id for the whole run, so the
+    universe only grows by the events that are new in a step. The id doubles as bit index,
+    which allows to represent any set of known events as a single integer mask.
+    """
+
+    def __init__(self) -> None:
+        self.__events: List[BEvent] = []
+        self.__id_by_event: Dict[BEvent, int] = dict()
+        self.__mask_by_name: Dict[str, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.__events)
+
+    @property
+    def events(self) -> List[BEvent]:
+        # the list is only ever appended to, callers must not modify it
+        return self.__events
+
+    @property
+    def version(self) -> int:
+        return len(self.__events)
+
+    def intern(self, event: BEvent) -> int:
+        event_id = self.__id_by_event.get(event)
+        if event_id is None:
+            event_id = len(self.__events)
+            self.__events.append(event)
+            self.__id_by_event[event] = event_id
+            # events with different data share their name, so a name can cover several bits
+            self.__mask_by_name[event.name] = self.__mask_by_name.get(event.name, 0) | (1 << event_id)
+        return event_id
+
+    def event_id(self, event: BEvent) -> Optional[int]:
+        return self.__id_by_event.get(event)
+
+    def event(self, event_id: int) -> BEvent:
+        return self.__events[event_id]
+
+    @property
+    def full_mask(self) -> int:
+        return (1 << len(self.__events)) - 1
+
+    def name_mask(self, name: str) -> int:
+        return self.__mask_by_name.get(name, 0)
+
+    def ids(self, mask: int) -> List[int]:
+        result = []
+        while mask:
+            lowest_bit = mask & -mask
+            result.append(lowest_bit.bit_length() - 1)
+            mask ^= lowest_bit
+        return result
+
+    def decode(self, mask: int) -> List[BEvent]:
+        return [self.__events[event_id] for event_id in self.ids(mask)]
+
+    def names(self, mask: int) -> List[str]:
+        return [event.name for event in self.decode(mask)]
+
+    def register(self, event_set: Any) -> None:
+        # only explicitly named events can be learned, predicates are resolved against them later on
+        if isinstance(event_set, BEvent):
+            self.intern(event_set)
+        elif isinstance(event_set, list):
+            for e in event_set:
+                self.register(e)
+        elif isinstance(event_set, EventSetList):
+            for e in event_set.lst:
+                self.register(e)
+
+
+class _Expansion(NamedTuple):
+    event_set: EventSet
+    version: int
+    mask: int
+
+
+class EventSetExpander:
+    """Expands event sets into bit masks over the known events of an EventRegistry.
+
+    Predicate based event sets are memoized by identity together with the registry version they
+    were expanded against. As the registry only grows, an outdated expansion is completed by
+    testing the newly known events only. The cache is bounded and evicts the least recently used sets.
+    """
+
+    def __init__(self, registry: EventRegistry, max_size: int = 1024) -> None:
+        self.__registry = registry
+        self.__max_size = max_size
+        self.__cache: OrderedDict[int, _Expansion] = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def expand(self, event_set: Any) -> List[BEvent]:
+        return self.__registry.decode(self.expand_mask(event_set))
+
+    def expand_mask(self, event_set: Any) -> int:
+        if event_set is None:
+            return 0
+        elif isinstance(event_set, list):
+            result = 0
+            for e in event_set:
+                result |= self.expand_mask(e)
+            return result
+        elif isinstance(event_set, EmptyEventSet):
+            return 0
+        elif isinstance(event_set, All):
+            return self.__registry.full_mask
+        elif isinstance(event_set, EventSetList):
+            return self.expand_mask(event_set.lst)
+        elif isinstance(event_set, EventSet):
+            # AllExcept and EventSet can be handled via the predicate
+            return self.__expand_predicate(event_set)
+        else:
+            return 1 << self.__registry.intern(event_set)
+
+    def __expand_predicate(self, event_set: EventSet) -> int:
+        key = id(event_set)
+        version = self.__registry.version
+        cached = self.__cache.get(key)
+        # the cache holds a reference to the event set, so its id can not be reused while cached
+        if cached is not None and cached.event_set is event_set:
+            self.__cache.move_to_end(key)
+            self.__hits += 1
+            if cached.version == version:
+                return cached.mask
+            mask = cached.mask | self.__test_events(event_set, cached.version, version)
+        else:
+            self.__misses += 1
+            mask = self.__test_events(event_set, 0, version)
+        self.__cache[key] = _Expansion(event_set, version, mask)
+        while len(self.__cache) > self.__max_size:
+            self.__cache.popitem(last=False)
+        return mask
+
+    def __test_events(self, event_set: EventSet, start: int, end: int) -> int:
+        mask = 0
+        events = self.__registry.events
+        for event_id in range(start, end):
+            if event_set.predicate(events[event_id]):
+                mask |= 1 << event_id
+        return mask
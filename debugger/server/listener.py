@@ -1,14 +1,28 @@
+import asyncio
 import json
 import time
 from datetime import datetime
-from multiprocessing import Queue
 from threading import Thread, Lock
-from typing import Dict, Callable, Any, List, Optional
+from typing import Dict, Callable, Any, List, AsyncIterator, Optional, Tuple
 
-from bppy import BProgramRunnerListener, BProgram, BEvent, All, EventSetList, EventSet, EmptyEventSet
+from bppy import BProgramRunnerListener, BProgram, BEvent, EventSet
 from flask import Flask, Response, request
 
+from debugger.server.async_transport import AsyncTransport
 from debugger.server.break_point import BreakpointRepository, Breakpoint, DifferenceBreakpoint
+from debugger.server.capture_window import CaptureWindow
+from debugger.server.metrics import Histogram, format_histograms, format_value
+from debugger.server.sampling import Sampler
+from debugger.server.trace_buffer import TraceBuffer, OverflowPolicy, DEFAULT_CAPACITY
+from debugger.server.trace_pipeline import (
+    TraceBuilder, TracePipeline, StepSnapshot, SyncSnapshot, StepState, DEFAULT_ARCHIVE_SIZE
+)
+from debugger.trace.binary import BinaryEncoder
+from debugger.trace.delta import DeltaEncoder, DEFAULT_KEYFRAME_INTERVAL
+
+
+DEFAULT_BATCH_INTERVAL = 50
+STEP_PHASES = ("lock_wait", "snapshot", "inner_listener", "parameter_poll", "enqueue", "breakpoints")
 
 
 def _format_sse(data: str, event=None) -> str:
@@ -18,56 +32,42 @@ def _format_sse(data: str, event=None) -> str:
     return msg
 
 
-def _extract_event_names_if_known(event_set: Any, known_events: Optional[List[BEvent]] = None) -> List[BEvent]:
-    if known_events is None:
-        known_events_list = []
-    else:
-        known_events_list = known_events
-    if isinstance(event_set, list):
-        result = []
-        for e in event_set:
-            result.extend(_extract_event_names_if_known(e, known_events))
-        return result
-    else:
-        if event_set is None:
-            return []
-        elif isinstance(event_set, EmptyEventSet):
-            return []
-        elif isinstance(event_set, All):
-            return known_events_list
-        elif isinstance(event_set, EventSetList):
-            return [event for event in event_set.lst]
-        elif isinstance(event_set, EventSet):
-            # AllExcept and EventSet can be handled via the predicate
-            result = []
-            for event in known_events_list:
-                if event_set.predicate(event):
-                    result.append(event)
-            return result
-        else:
-            return [event_set]
-
-
-def _get_all_events(state_info: List[Dict[str, Any]]) -> List[BEvent]:
-    result = []
-    for t in state_info:
-        possible_event_sets = {
-            "request": t.get("request"),
-            "wait_for": t.get("waitFor"),
-            "block": t.get("block"),
-        }
-        for _, event_set in possible_event_sets.items():
-            result.extend(_extract_event_names_if_known(event_set))
-    return list(set(result))
-
-
 class MonitoringListener(BProgramRunnerListener):
-    def __init__(self, listener: BProgramRunnerListener, name: str, port: int = 5000) -> None:
+    def __init__(
+            self,
+            listener: BProgramRunnerListener,
+            name: str,
+            port: int = 5000,
+            buffer_capacity: int = DEFAULT_CAPACITY,
+            overflow_policy: OverflowPolicy = OverflowPolicy.COALESCE,
+            asynchronous: bool = False,
+            lazy_b_thread_info: bool = False,
+            archive_size: int = DEFAULT_ARCHIVE_SIZE,
+            capture_window: Optional[Tuple[int, int]] = None,
+            sampler: Optional[Sampler] = None,
+    ) -> None:
         self.__listener = listener
         self.__flask_app = Flask(name)
         self.__flask_task = Thread(target=self.__flask_app.run, kwargs={"port": port, "threaded": True})
-        self.__event_queue = Queue()
+        self.__trace_buffer = TraceBuffer(buffer_capacity, overflow_policy)
+        self.__async_transport: Optional[AsyncTransport] = None
+        if asynchronous:
+            self.__async_transport = AsyncTransport(self.__flask_app, port)
+            self.__async_transport.stream_route("/listen", self.__async_client_listen)
+            self.__trace_notifier = self.__async_transport.notifier()
+            self.__trace_buffer.on_put(self.__trace_notifier.notify)
         self.__b_thread_by_name = dict()
+        self.__trace_builder = TraceBuilder(lazy_b_thread_info, archive_size)
+        # only the pre- and post-trigger frames around a fired breakpoint are streamed
+        self.__capture_window: Optional[CaptureWindow] = None
+        if capture_window is not None:
+            self.__capture_window = CaptureWindow(*capture_window)
+        self.__trace_pipeline = TracePipeline(
+            self.__trace_builder, self.__trace_buffer.put, buffer_capacity, self.__capture_window
+        )
+        self.__sampler = sampler if sampler is not None else Sampler()
+        self.__phase_durations = {phase: Histogram() for phase in STEP_PHASES}
+        self.__untraced_steps = 0
         self.__data_to_send = lambda: dict()
         self.current_id = 0
 
@@ -78,7 +78,14 @@ class MonitoringListener(BProgramRunnerListener):
         self.__flask_app.route("/step")(self.__step)
         self.__flask_app.route("/breakpoints/add", methods=["POST"])(self.__add_breakpoint)
         self.__flask_app.route("/breakpoints/delete/<b_id>")(self.__delete_breakpoint)
+        self.__flask_app.route("/breakpoints/bulk/add", methods=["POST"])(self.__add_breakpoints)
+        self.__flask_app.route("/breakpoints/bulk/delete", methods=["POST"])(self.__delete_breakpoints)
+        self.__flask_app.route("/breakpoints/bulk/pause", methods=["POST"])(self.__pause_breakpoints)
+        self.__flask_app.route("/breakpoints/bulk/unpause", methods=["POST"])(self.__unpause_breakpoints)
         self.__flask_app.route("/connect")(self.__client_connect)
+        self.__flask_app.route("/events")(self.__get_events)
+        self.__flask_app.route("/stateData")(self.__get_state_data)
+        self.__flask_app.route("/metrics")(self.__get_metrics)
         self.__flask_app.route("/setParameter/<parameter>/<new_value>")(self.__set_parameter)
 
         self.__timeout = 0
@@ -97,17 +104,174 @@ class MonitoringListener(BProgramRunnerListener):
             value.pop("callback", None)
         return Response(json.dumps(to_send))
 
+    def __get_events(self) -> Response:
+        # the registry is append-only, so a consumer can expand any symbolic event set of an earlier step with it
+        return Response(json.dumps(self.__trace_builder.known_events()))
+
+    def __get_state_data(self) -> Response:
+        # b-thread infos of the requested steps, only expanded now if the listener is lazy
+        b_thread_info_by_id = {
+            state_id: self.__trace_builder.archived_b_thread_info(int(state_id))
+            for state_id in request.args.get("ids", "").split(",")
+            if state_id != ""
+        }
+        return Response(json.dumps(b_thread_info_by_id))
+
+    def __get_metrics(self) -> Response:
+        metrics = [
+            format_histograms(
+                "bp_debugger_step_phase_seconds",
+                "Time spent in the phases of event_selected on the b-program thread.",
+                "phase",
+                self.__phase_durations,
+            ),
+            format_histograms(
+                "bp_debugger_frame_build_seconds",
+                "Time the pipeline worker spent building a trace frame.",
+                "worker",
+                {"pipeline": self.__trace_pipeline.build_durations},
+            ),
+            format_value(
+                "bp_debugger_pipeline_queue_depth",
+                "Snapshots and frames waiting for the pipeline worker.",
+                self.__trace_pipeline.queue_depth,
+            ),
+            format_value(
+                "bp_debugger_trace_buffer_depth",
+                "Frames in the trace buffer not yet read by every subscriber.",
+                len(self.__trace_buffer),
+            ),
+            format_value(
+                "bp_debugger_subscribers",
+                "Current subscribers of the trace stream.",
+                self.__trace_buffer.subscriber_count,
+            ),
+            format_value(
+                "bp_debugger_frames_dropped_total",
+                "Trace frames dropped for slow subscribers.",
+                self.__trace_buffer.dropped,
+                "counter",
+            ),
+            format_value(
+                "bp_debugger_frames_coalesced_total",
+                "Trace frames coalesced into gap markers for slow subscribers.",
+                self.__trace_buffer.coalesced,
+                "counter",
+            ),
+            format_value(
+                "bp_debugger_steps_sampled_out_total",
+                "Steps the sampler did not trace.",
+                self.__sampler.sampled_out,
+                "counter",
+            ),
+            format_value(
+                "bp_debugger_steps_untraced_total",
+                "Steps nobody observed, which took the fast path.",
+                self.__untraced_steps,
+                "counter",
+            ),
+        ]
+        return Response("".join(metrics), mimetype="text/plain; version=0.0.4")
+
+    @staticmethod
+    def __create_delta_encoder(arguments: Dict[str, str]) -> Optional[DeltaEncoder]:
+        if arguments.get("encoding") == "delta":
+            return DeltaEncoder(int(arguments.get("keyframe_interval", DEFAULT_KEYFRAME_INTERVAL)))
+        return None
+
+    @staticmethod
+    def __parse_batching(arguments: Dict[str, str]) -> Tuple[int, float]:
+        batch_size = int(arguments.get("batch_size", 1))
+        batch_interval = float(arguments.get("batch_interval", DEFAULT_BATCH_INTERVAL)) / 1000
+        return batch_size, batch_interval
+
+    @staticmethod
+    def __create_binary_encoder(arguments: Dict[str, str]) -> Optional[BinaryEncoder]:
+        if arguments.get("format") == "binary":
+            return BinaryEncoder()
+        return None
+
+    @staticmethod
+    def __format_frames(
+            frames: List[Dict[str, Any]],
+            delta_encoder: Optional[DeltaEncoder],
+            binary_encoder: Optional[BinaryEncoder],
+    ) -> str | bytes:
+        if delta_encoder is not None:
+            frames = [delta_encoder.encode(frame) for frame in frames]
+        message = frames[0] if len(frames) == 1 else {"type": "batch", "frames": frames}
+        if binary_encoder is not None:
+            return binary_encoder.encode(message)
+        return _format_sse(json.dumps(message))
+
     def __client_listen(self) -> Response:
+        delta_encoder = self.__create_delta_encoder(request.args)
+        binary_encoder = self.__create_binary_encoder(request.args)
+        batch_size, batch_interval = self.__parse_batching(request.args)
+
         def stream():
-            while True:
-                data = self.__event_queue.get()
-                yield _format_sse(json.dumps(data))
+            subscription = self.__trace_buffer.subscribe()
+            try:
+                while True:
+                    if batch_size > 1:
+                        frames = subscription.get_batch(batch_size, batch_interval)
+                    else:
+                        frames = [subscription.get()]
+                    yield self.__format_frames(frames, delta_encoder, binary_encoder)
+            finally:
+                self.__trace_buffer.unsubscribe(subscription)
         return Response(
             stream(),
-            mimetype='text/event-stream',
+            mimetype='text/event-stream' if binary_encoder is None else 'application/octet-stream',
             headers={"Access-Control-Allow-Origin": "*"}
         )
 
+    def __async_client_listen(self, arguments: Dict[str, str]) -> Tuple[str, AsyncIterator[str | bytes]]:
+        binary_encoder = self.__create_binary_encoder(arguments)
+        content_type = 'text/event-stream' if binary_encoder is None else 'application/octet-stream'
+        return content_type, self.__async_stream(arguments, binary_encoder)
+
+    async def __async_stream(
+            self,
+            arguments: Dict[str, str],
+            binary_encoder: Optional[BinaryEncoder],
+    ) -> AsyncIterator[str | bytes]:
+        delta_encoder = self.__create_delta_encoder(arguments)
+        batch_size, batch_interval = self.__parse_batching(arguments)
+        loop = asyncio.get_running_loop()
+        subscription = self.__trace_buffer.subscribe()
+        try:
+            while True:
+                data = subscription.poll()
+                if data is None:
+                    await self.__trace_notifier.wait()
+                    continue
+                frames = [data]
+                deadline = loop.time() + batch_interval
+                while len(frames) < batch_size:
+                    data = subscription.poll()
+                    if data is None:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        await self.__trace_notifier.wait(remaining)
+                        continue
+                    frames.append(data)
+                yield self.__format_frames(frames, delta_encoder, binary_encoder)
+        finally:
+            self.__trace_buffer.unsubscribe(subscription)
+
+    def __is_observed(self) -> bool:
+        # a step has to be traced if somebody listens, a breakpoint could fire or the program has to be halted,
+        # while stepping the run lock is released for a moment, but the program must not run on untraced
+        return bool(
+            self.__trace_buffer.subscriber_count
+            or self.__breakpoint_repository
+            or self.__set_break_point
+            or self.__stepping
+            or self.__run_lock.locked()
+        )
+
     def __pause(self) -> str:
         self.__run_lock.acquire()
         self.__send_paused()
@@ -131,18 +295,41 @@ class MonitoringListener(BProgramRunnerListener):
         self.__timeout = float(timeout)
         return ""
 
-    def __add_breakpoint(self) -> str:
-        json_break_point: dict = request.json
+    @staticmethod
+    def __breakpoint_from_json(json_break_point: dict) -> Breakpoint:
         if json_break_point["id"] == "0":
-            self.__breakpoint_repository.add_breakpoint(DifferenceBreakpoint.from_json(json_break_point))
-        else:
-            self.__breakpoint_repository.add_breakpoint(Breakpoint.from_json(json_break_point))
+            return DifferenceBreakpoint.from_json(json_break_point)
+        return Breakpoint.from_json(json_break_point)
+
+    def __add_breakpoint(self) -> str:
+        self.__breakpoint_repository.add_breakpoint(self.__breakpoint_from_json(request.json))
         return ""
 
     def __delete_breakpoint(self, b_id: str) -> str:
         self.__breakpoint_repository.delete_breakpoint(b_id)
         return ""
 
+    def __add_breakpoints(self) -> str:
+        json_break_points: List[dict] = request.json
+        # loaded breakpoints may come in their paused state
+        self.__breakpoint_repository.add_breakpoints(
+            [self.__breakpoint_from_json(b) for b in json_break_points],
+            {b["id"] for b in json_break_points if b.get("paused", False)},
+        )
+        return ""
+
+    def __delete_breakpoints(self) -> str:
+        self.__breakpoint_repository.delete_breakpoints(request.json)
+        return ""
+
+    def __pause_breakpoints(self) -> str:
+        self.__breakpoint_repository.pause_breakpoints(request.json)
+        return ""
+
+    def __unpause_breakpoints(self) -> str:
+        self.__breakpoint_repository.unpause_breakpoints(request.json)
+        return ""
+
     def __set_parameter(self, parameter: str, new_value: str) -> str:
         value_type = type(self.__data_to_send()[parameter]["value"])
         if value_type == int:
@@ -157,7 +344,7 @@ class MonitoringListener(BProgramRunnerListener):
         return ""
 
     def __send_paused(self, *breakpoint_id: str) -> None:
-        self.__event_queue.put(
+        self.__trace_pipeline.submit_frame(
             {
                 "type": "info",
                 "paused": True,
@@ -167,7 +354,7 @@ class MonitoringListener(BProgramRunnerListener):
         )
 
     def __send_ended(self) -> None:
-        self.__event_queue.put(
+        self.__trace_pipeline.submit_frame(
             {
                 "type": "info",
                 "paused": True,
@@ -180,11 +367,19 @@ class MonitoringListener(BProgramRunnerListener):
         self.__b_thread_by_name[b_thread] = name
         return b_thread
 
+    def mark_event_set(self, name: str, event_set: EventSet) -> EventSet:
+        self.__trace_builder.mark_event_set(name, event_set)
+        return event_set
+
     def register_data_poll(self, data_poll: Callable[[], Dict[str, Dict[str, str | int | bool]]]) -> None:
         self.__data_to_send = data_poll
 
     def starting(self, b_program: BProgram):
-        self.__flask_task.start()
+        self.__trace_pipeline.start()
+        if self.__async_transport is not None:
+            self.__async_transport.start()
+        else:
+            self.__flask_task.start()
         return self.__listener.starting(b_program)
 
     def started(self, b_program: BProgram):
@@ -210,7 +405,14 @@ class MonitoringListener(BProgramRunnerListener):
         return self.__listener.b_thread_done(b_program)
 
     def event_selected(self, b_program: BProgram, event: BEvent):
+        if not self.__is_observed():
+            # fast path: nobody would ever see this step, only keep the ids consistent
+            self.current_id += 1
+            self.__untraced_steps += 1
+            return self.__listener.event_selected(b_program, event)
         time.sleep(self.__timeout)
+        phase_durations = self.__phase_durations
+        start = time.perf_counter()
         if self.__set_break_point:
             if not self.__stepping:
                 self.__run_lock.acquire()
@@ -219,41 +421,57 @@ class MonitoringListener(BProgramRunnerListener):
         self.__step_lock.acquire()
         self.__run_lock.acquire()
         try:
-            selected = event.name
-            final_data = {"selected": selected, "b_thread_info": []}
-            tickets = b_program.tickets
-            all_events = _get_all_events(tickets)
-            t: dict
-            for t in tickets:
-                # base infos
-                if len(t) == 0:
-                    continue
-                b_thread_name = self.__b_thread_by_name[t["bt"]]
-                priority = t.get("priority", 0)
-                possible_event_sets = {
-                    "request": t.get("request"),
-                    "wait_for": t.get("waitFor"),
-                    "block": t.get("block"),
-                }
-
-                # break down of event sets
-                b_thread_info = {"name": b_thread_name, "priority": priority}
-                for tag, event_set in possible_event_sets.items():
-                    b_thread_info[tag] = [e.name for e in _extract_event_names_if_known(event_set, all_events)]
-                final_data["b_thread_info"].append(b_thread_info)
-
+            now = time.perf_counter()
+            phase_durations["lock_wait"].observe(now - start)
+            start = now
+            # only references are captured here, the trace frame is built by the pipeline worker
+            sync_statements = tuple(
+                SyncSnapshot(
+                    self.__b_thread_by_name[t["bt"]],
+                    t.get("priority", 0),
+                    t.get("request"),
+                    t.get("waitFor"),
+                    t.get("block"),
+                )
+                for t in b_program.tickets
+                if len(t) != 0
+            )
+            registry_version = self.__trace_builder.register_step(event, sync_statements)
+            now = time.perf_counter()
+            phase_durations["snapshot"].observe(now - start)
+            start = now
             result = self.__listener.event_selected(b_program, event)
-            final_data["parameters"] = self.__data_to_send()
-            for values in final_data["parameters"].values():
-                values.pop("callback", None)
-            final_data["datetime"] = datetime.now().timestamp()
-            final_data["id"] = self.current_id
-            final_data["type"] = "trace"
+            now = time.perf_counter()
+            phase_durations["inner_listener"].observe(now - start)
+            start = now
+            parameters = self.__data_to_send()
+            now = time.perf_counter()
+            phase_durations["parameter_poll"].observe(now - start)
+            start = now
+            snapshot = StepSnapshot(
+                self.current_id,
+                event,
+                datetime.now().timestamp(),
+                sync_statements,
+                parameters,
+                registry_version,
+            )
             self.current_id += 1
-            self.__event_queue.put(final_data)
-
-            if self.__breakpoint_repository.advance_break_points(final_data):
-                self.__set_break_point = True
+            # sampled out steps still count and advance the breakpoints
+            if self.__sampler.sample(snapshot):
+                self.__trace_pipeline.submit(snapshot)
+            now = time.perf_counter()
+            phase_durations["enqueue"].observe(now - start)
+            start = now
+
+            if self.__breakpoint_repository.advance_break_points(StepState(snapshot, self.__trace_builder)):
+                if self.__capture_window is not None:
+                    self.__trace_pipeline.submit_frame(
+                        CaptureWindow.trigger_frame(snapshot.step_id, list(self.__breakpoint_repository.which()))
+                    )
+                if self.__breakpoint_repository.pausing_fired():
+                    self.__set_break_point = True
+            phase_durations["breakpoints"].observe(time.perf_counter() - start)
 
             return result
         finally:
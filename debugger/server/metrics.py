@@ -0,0 +1,58 @@
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# in seconds, from a cheap phase of a single step up to a b-program halted by the user
+DEFAULT_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """Distribution of observed values, exposed as cumulative buckets like a Prometheus histogram.
+
+    Observations are expected from a single thread, readers may see a slightly outdated state.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.__buckets = buckets
+        # the last count is the +Inf bucket
+        self.__counts = [0] * (len(buckets) + 1)
+        self.__sum = 0.0
+        self.__count = 0
+
+    @property
+    def sum(self) -> float:
+        return self.__sum
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    def observe(self, value: float) -> None:
+        self.__counts[bisect_left(self.__buckets, value)] += 1
+        self.__sum += value
+        self.__count += 1
+
+    def cumulative_buckets(self) -> List[Tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, count in zip(self.__buckets, self.__counts):
+            total += count
+            result.append((repr(bound), total))
+        result.append(("+Inf", total + self.__counts[-1]))
+        return result
+
+
+def format_histograms(name: str, description: str, label: str, histograms: Dict[str, Histogram]) -> str:
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+    for value, histogram in histograms.items():
+        for bound, count in histogram.cumulative_buckets():
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.sum!r}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+    return "\n".join(lines) + "\n"
+
+
+def format_value(name: str, description: str, value: float, metric_type: str = "gauge") -> str:
+    return f"# HELP {name} {description}\n# TYPE {name} {metric_type}\n{name} {value}\n"
@@ -0,0 +1,143 @@
+from datetime import datetime
+from typing import Dict, Callable, Any, Optional, Tuple
+
+from bppy import BProgramRunnerListener, BProgram, BEvent, EventSet
+
+from debugger.server.break_point import BreakpointRepository, Breakpoint
+from debugger.server.capture_window import CaptureWindow
+from debugger.server.sampling import Sampler
+from debugger.server.trace_buffer import DEFAULT_CAPACITY
+from debugger.server.trace_pipeline import TraceBuilder, TracePipeline, StepSnapshot, SyncSnapshot, StepState
+from debugger.trace.recording import RecordingWriter, DEFAULT_SEGMENT_SIZE
+from debugger.trace.sync_statements import SyncStatementTable
+
+
+class RecordingListener(BProgramRunnerListener):
+    """Headless sibling of the MonitoringListener, records every step into segment files.
+
+    No server is started, so the b-program can neither be paused nor stepped. Whenever the
+    known events grow, an events frame is recorded before the next trace frame, which allows
+    to expand the symbolic event sets of a recording without the b-program. Trace frames only
+    reference the sync statements of their b-threads, each distinct statement is recorded once.
+    With a capture window, only the steps around the firing of a trigger are recorded.
+    """
+
+    def __init__(
+            self,
+            listener: BProgramRunnerListener,
+            directory: str,
+            segment_size: int = DEFAULT_SEGMENT_SIZE,
+            compress: bool = False,
+            queue_capacity: int = DEFAULT_CAPACITY,
+            capture_window: Optional[Tuple[int, int]] = None,
+            sampler: Optional[Sampler] = None,
+    ) -> None:
+        self.__listener = listener
+        self.__recording_writer = RecordingWriter(directory, segment_size, compress)
+        self.__b_thread_by_name = dict()
+        self.__trace_builder = TraceBuilder()
+        self.__capture_window: Optional[CaptureWindow] = None
+        if capture_window is not None:
+            self.__capture_window = CaptureWindow(*capture_window)
+        self.__trace_pipeline = TracePipeline(self.__trace_builder, self.__record, queue_capacity, self.__capture_window)
+        self.__trigger_repository = BreakpointRepository()
+        self.__sampler = sampler if sampler is not None else Sampler()
+        self.__recorded_events_version = -1
+        self.__sync_statement_table = SyncStatementTable()
+        self.__data_to_send = lambda: dict()
+        self.current_id = 0
+
+    def __record(self, frame: Dict[str, Any]) -> None:
+        events_version = self.__trace_builder.known_events_version
+        if events_version != self.__recorded_events_version:
+            self.__recorded_events_version = events_version
+            self.__recording_writer.write(dict(self.__trace_builder.known_events(), type="events"))
+        frame, definitions = self.__sync_statement_table.deduplicate(frame)
+        if definitions:
+            self.__recording_writer.write({"type": "sync_statements", "definitions": definitions})
+        self.__recording_writer.write(frame)
+
+    def add_trigger(self, trigger: Breakpoint) -> None:
+        self.__trigger_repository.add_breakpoint(trigger)
+
+    def mark_name(self, name: str, b_thread):
+        self.__b_thread_by_name[b_thread] = name
+        return b_thread
+
+    def mark_event_set(self, name: str, event_set: EventSet) -> EventSet:
+        self.__trace_builder.mark_event_set(name, event_set)
+        return event_set
+
+    def register_data_poll(self, data_poll: Callable[[], Dict[str, Dict[str, str | int | bool]]]) -> None:
+        self.__data_to_send = data_poll
+
+    def starting(self, b_program: BProgram):
+        self.__trace_pipeline.start()
+        return self.__listener.starting(b_program)
+
+    def started(self, b_program: BProgram):
+        return self.__listener.started(b_program)
+
+    def super_step_done(self, b_program: BProgram):
+        return self.__listener.super_step_done(b_program)
+
+    def ended(self, b_program: BProgram):
+        self.__trace_pipeline.submit_frame(
+            {
+                "type": "info",
+                "paused": True,
+                "ended": True,
+                "breakpoint_ids": list(),
+            }
+        )
+        self.__trace_pipeline.join()
+        self.__recording_writer.close()
+        return self.__listener.ended(b_program)
+
+    def assertion_failed(self, b_program: BProgram):
+        return self.__listener.assertion_failed(b_program)
+
+    def b_thread_added(self, b_program: BProgram):
+        return self.__listener.b_thread_added(b_program)
+
+    def b_thread_removed(self, b_program: BProgram):
+        return self.__listener.b_thread_removed(b_program)
+
+    def b_thread_done(self, b_program: BProgram):
+        return self.__listener.b_thread_done(b_program)
+
+    def event_selected(self, b_program: BProgram, event: BEvent):
+        sync_statements = tuple(
+            SyncSnapshot(
+                self.__b_thread_by_name[t["bt"]],
+                t.get("priority", 0),
+                t.get("request"),
+                t.get("waitFor"),
+                t.get("block"),
+            )
+            for t in b_program.tickets
+            if len(t) != 0
+        )
+        registry_version = self.__trace_builder.register_step(event, sync_statements)
+        result = self.__listener.event_selected(b_program, event)
+        snapshot = StepSnapshot(
+            self.current_id,
+            event,
+            datetime.now().timestamp(),
+            sync_statements,
+            self.__data_to_send(),
+            registry_version,
+        )
+        if self.__sampler.sample(snapshot):
+            self.__trace_pipeline.submit(snapshot)
+        self.current_id += 1
+        if self.__trigger_repository and self.__trigger_repository.advance_break_points(
+                StepState(snapshot, self.__trace_builder)
+        ):
+            self.__trace_pipeline.submit_frame(
+                CaptureWindow.trigger_frame(snapshot.step_id, list(self.__trigger_repository.which()))
+            )
+        return result
+
+    def halted(self, b_program: BProgram):
+        return self.__listener.halted(b_program)
@@ -0,0 +1,53 @@
+import time
+from enum import Enum
+from typing import Dict, Any, Optional
+
+from debugger.server.trace_pipeline import StepSnapshot
+
+
+class SamplingPolicy(Enum):
+    ALL = "all"
+    EVERY_NTH = "every_nth"
+    MAX_RATE = "max_rate"
+    ON_CHANGE = "on_change"
+
+
+class Sampler:
+    """Decides which steps are traced, the others are only counted.
+
+    EVERY_NTH traces every n-th step, MAX_RATE at most n steps per second and ON_CHANGE only
+    the steps whose selected event or parameter values differ from the previous step.
+    """
+
+    def __init__(self, policy: SamplingPolicy = SamplingPolicy.ALL, n: float = 1) -> None:
+        if policy in (SamplingPolicy.EVERY_NTH, SamplingPolicy.MAX_RATE) and n <= 0:
+            raise ValueError(f"The sampling policy {policy.value} needs a positive n")
+        self.__policy = policy
+        self.__n = n
+        self.__last_sampled = -1.0
+        self.__last_selected: Optional[str] = None
+        self.__last_values: Optional[Dict[str, Any]] = None
+        self.__sampled_out = 0
+
+    @property
+    def sampled_out(self) -> int:
+        return self.__sampled_out
+
+    def sample(self, snapshot: StepSnapshot) -> bool:
+        if self.__policy == SamplingPolicy.ALL:
+            sampled = True
+        elif self.__policy == SamplingPolicy.EVERY_NTH:
+            sampled = snapshot.step_id % self.__n == 0
+        elif self.__policy == SamplingPolicy.MAX_RATE:
+            now = time.monotonic()
+            sampled = self.__last_sampled < 0 or now - self.__last_sampled >= 1 / self.__n
+            if sampled:
+                self.__last_sampled = now
+        else:
+            values = {name: parameter.get("value") for name, parameter in snapshot.parameters.items()}
+            sampled = snapshot.selected.name != self.__last_selected or values != self.__last_values
+            self.__last_selected = snapshot.selected.name
+            self.__last_values = values
+        if not sampled:
+            self.__sampled_out += 1
+        return sampled
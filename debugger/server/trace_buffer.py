@@ -0,0 +1,200 @@
+from collections import deque
+from enum import Enum
+import time
+from threading import Condition
+from typing import Dict, Any, Deque, List, Optional, Callable
+
+DEFAULT_CAPACITY = 10000
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+
+
+def _new_gap() -> Dict[str, Any]:
+    return {"type": "gap", "count": 0, "first_id": None, "last_id": None}
+
+
+def _merge_into_gap(gap: Dict[str, Any], frame: Dict[str, Any]) -> None:
+    if frame["type"] != "trace":
+        return
+    gap["count"] += 1
+    if gap["first_id"] is None:
+        gap["first_id"] = frame["id"]
+    gap["last_id"] = frame["id"]
+
+
+class Subscription:
+    """Cursor of a single consumer into the shared log of a TraceBuffer."""
+
+    def __init__(self, trace_buffer: "TraceBuffer", sequence: int) -> None:
+        self.__trace_buffer = trace_buffer
+        self.sequence = sequence
+        self.gap: Optional[Dict[str, Any]] = None
+        # control frames, e.g. paused, ended or trigger frames, evicted before the subscriber read them
+        self.controls: Deque[Dict[str, Any]] = deque()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self.__trace_buffer.read(self, timeout=timeout)
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        return self.__trace_buffer.read(self, block=False)
+
+    def get_batch(self, size: int, interval: float) -> List[Dict[str, Any]]:
+        # waits for the first frame, afterwards for at most interval seconds or until size frames are collected
+        batch = [self.get()]
+        deadline = time.monotonic() + interval
+        while len(batch) < size:
+            frame = self.poll()
+            if frame is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                frame = self.get(timeout=remaining)
+                if frame is None:
+                    break
+            batch.append(frame)
+        return batch
+
+
+class TraceBuffer:
+    """Bounded in-process log between the b-program and any number of trace consumers.
+
+    Every subscriber owns a cursor into the same log, so each of them receives every frame
+    without the frames being copied. Frames are released as soon as all subscribers read them.
+    If a slow subscriber lets the log run full, the overflow policy decides whether the producer
+    waits, the oldest frame is dropped for that subscriber or the frames it missed are coalesced
+    into a single gap marker carrying the skipped trace ids. Control frames are never lost, the
+    ones evicted unread are delivered to the subscriber after its gap.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, policy: OverflowPolicy = OverflowPolicy.COALESCE) -> None:
+        if capacity < 1:
+            raise ValueError("The capacity of a trace buffer has to be at least 1")
+        self.__capacity = capacity
+        self.__policy = policy
+        self.__frames: Deque[Dict[str, Any]] = deque()
+        self.__first_sequence = 0
+        self.__subscriptions: List[Subscription] = []
+        self.__condition = Condition()
+        self.__dropped = 0
+        self.__coalesced = 0
+        self.__put_callbacks: List[Callable[[], None]] = []
+
+    def __len__(self) -> int:
+        return len(self.__frames)
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self.__subscriptions)
+
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+
+    @property
+    def coalesced(self) -> int:
+        return self.__coalesced
+
+    def on_put(self, callback: Callable[[], None]) -> None:
+        # callbacks are invoked by the producing thread and must not block
+        self.__put_callbacks.append(callback)
+
+    def subscribe(self) -> Subscription:
+        with self.__condition:
+            subscription = Subscription(self, self.__first_sequence + len(self.__frames))
+            self.__subscriptions.append(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.__condition:
+            self.__subscriptions.remove(subscription)
+            self.__release_read_frames()
+            self.__condition.notify_all()
+
+    def put(self, frame: Dict[str, Any]) -> None:
+        with self.__condition:
+            if not self.__subscriptions:
+                # nobody could ever read the frame
+                return
+            if len(self.__frames) >= self.__capacity:
+                if self.__policy == OverflowPolicy.BLOCK:
+                    while len(self.__frames) >= self.__capacity and self.__subscriptions:
+                        self.__condition.wait()
+                else:
+                    self.__evict_oldest()
+            self.__frames.append(frame)
+            self.__condition.notify_all()
+        for callback in self.__put_callbacks:
+            callback()
+
+    def read(
+            self,
+            subscription: Subscription,
+            block: bool = True,
+            timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__condition:
+            while True:
+                if subscription.gap is not None:
+                    gap = subscription.gap
+                    subscription.gap = None
+                    return gap
+                if subscription.controls:
+                    return subscription.controls.popleft()
+                index = subscription.sequence - self.__first_sequence
+                if index < len(self.__frames):
+                    frame = self.__frames[index]
+                    subscription.sequence += 1
+                    if index == 0:
+                        self.__release_read_frames()
+                        self.__condition.notify_all()
+                    return frame
+                if not block:
+                    return None
+                if deadline is None:
+                    self.__condition.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self.__condition.wait(remaining)
+
+    def __release_read_frames(self) -> None:
+        if self.__subscriptions:
+            slowest = min(subscription.sequence for subscription in self.__subscriptions)
+        else:
+            slowest = self.__first_sequence + len(self.__frames)
+        while self.__first_sequence < slowest:
+            self.__frames.popleft()
+            self.__first_sequence += 1
+
+    def __evict_oldest(self) -> None:
+        frame = self.__frames.popleft()
+        sequence = self.__first_sequence
+        self.__first_sequence += 1
+        for subscription in self.__subscriptions:
+            if subscription.sequence > sequence:
+                continue
+            subscription.sequence = sequence + 1
+            if frame["type"] != "trace":
+                if frame["type"] == "info":
+                    # a later info frame supersedes the earlier ones
+                    for control in [c for c in subscription.controls if c["type"] == "info"]:
+                        subscription.controls.remove(control)
+                subscription.controls.append(frame)
+                continue
+            if self.__policy == OverflowPolicy.DROP_OLDEST:
+                self.__dropped += 1
+            else:
+                if subscription.gap is None:
+                    subscription.gap = _new_gap()
+                _merge_into_gap(subscription.gap, frame)
+                self.__coalesced += 1
@@ -0,0 +1,284 @@
+import time
+from queue import Queue
+from threading import Thread, Lock
+from typing import Dict, Any, List, NamedTuple, Tuple, Callable, Optional
+
+from bppy import BEvent, EventSet, All, EmptyEventSet, EventSetList
+
+from debugger.server.capture_window import CaptureWindow
+from debugger.server.event_registry import EventRegistry, EventSetExpander
+from debugger.server.metrics import Histogram
+
+DEFAULT_ARCHIVE_SIZE = 100000
+
+
+def _is_open(event_set: Any) -> bool:
+    # an open event set is given by a predicate and may cover events that are not known yet
+    if isinstance(event_set, EventSetList):
+        return any(_is_open(item) for item in event_set.lst)
+    return isinstance(event_set, EventSet) and not isinstance(event_set, EmptyEventSet)
+
+
+class SyncSnapshot(NamedTuple):
+    b_thread_name: str
+    priority: int
+    request: Any
+    wait_for: Any
+    block: Any
+
+
+class StepSnapshot(NamedTuple):
+    """Everything the b-program thread captures of a step, the event sets are kept as references.
+
+    The registry version is the number of events known up to this step, the step is expanded
+    against exactly these events, no matter how many the registry knows by then.
+    """
+    step_id: int
+    selected: BEvent
+    timestamp: float
+    sync_statements: Tuple[SyncSnapshot, ...]
+    parameters: Dict[str, Dict[str, Any]]
+    registry_version: int
+
+
+class TraceBuilder:
+    """Turns step snapshots into trace frames.
+
+    The builder owns the event registry and is shared between the b-program thread, which only
+    expands a snapshot if a breakpoint asks for it, and the pipeline worker building the frames.
+    A lazy builder does not expand the b-thread infos of the frames at all, it keeps the
+    snapshots of the latest archive_size steps instead and expands one once a consumer asks
+    for that step. Older steps fall out of the archive, their b-thread infos are None.
+    """
+
+    def __init__(self, lazy: bool = False, archive_size: int = DEFAULT_ARCHIVE_SIZE) -> None:
+        self.__lock = Lock()
+        self.__lazy = lazy
+        self.__archive_size = archive_size
+        # in step order, so the oldest snapshot is always the first one
+        self.__snapshot_by_id: Dict[int, StepSnapshot] = dict()
+        self.__event_registry = EventRegistry()
+        self.__event_set_expander = EventSetExpander(self.__event_registry)
+        self.__name_by_event_set: Dict[int, str] = dict()
+        self.__mask_by_event_set_name: Dict[str, int] = dict()
+        # keeps the named event sets alive, so their ids can not be reused
+        self.__event_set_by_name: Dict[str, EventSet] = dict()
+        self.__known_events_version = 0
+        # changes whenever the mask of a named event set grows, named symbols carry it
+        self.__event_sets_version = 0
+
+    @property
+    def event_registry(self) -> EventRegistry:
+        return self.__event_registry
+
+    @property
+    def known_events_version(self) -> int:
+        # changes whenever known_events would return something new
+        return self.__known_events_version
+
+    def mark_event_set(self, name: str, event_set: EventSet) -> None:
+        with self.__lock:
+            self.__event_set_by_name[name] = event_set
+            self.__name_by_event_set[id(event_set)] = name
+
+    def known_events(self) -> Dict[str, Any]:
+        with self.__lock:
+            events = [event.name for event in self.__event_registry.events]
+            event_sets = {
+                set_name: self.__event_registry.ids(mask)
+                for set_name, mask in self.__mask_by_event_set_name.items()
+            }
+            event_sets_version = self.__event_sets_version
+        return {"events": events, "event_sets": event_sets, "event_sets_version": event_sets_version}
+
+    def register_step(self, selected: BEvent, sync_statements: Tuple[SyncSnapshot, ...]) -> int:
+        # called by the b-program thread in step order, so events get their ids in the order they
+        # first occur and the returned version of a step never covers events of later steps
+        with self.__lock:
+            registry_version = self.__event_registry.version
+            self.__event_registry.intern(selected)
+            for sync in sync_statements:
+                self.__event_registry.register(sync.request)
+                self.__event_registry.register(sync.wait_for)
+                self.__event_registry.register(sync.block)
+            if self.__event_registry.version != registry_version:
+                self.__known_events_version += 1
+            return self.__event_registry.version
+
+    def sync_masks(self, snapshot: StepSnapshot) -> List[Tuple[int, int, int]]:
+        with self.__lock:
+            return self.__sync_masks(snapshot)
+
+    def b_thread_info(self, snapshot: StepSnapshot) -> List[Dict[str, Any]]:
+        with self.__lock:
+            return self.__b_thread_info(snapshot, self.__sync_masks(snapshot))
+
+    def archived_b_thread_info(self, step_id: int) -> Optional[List[Dict[str, Any]]]:
+        snapshot = self.__snapshot_by_id.get(step_id)
+        if snapshot is None:
+            return None
+        return self.b_thread_info(snapshot)
+
+    def build_frame(self, snapshot: StepSnapshot) -> Dict[str, Any]:
+        parameters = snapshot.parameters
+        if self.__lazy:
+            # the parameters are part of the frame already, the archive only needs the sync statements
+            self.__snapshot_by_id[snapshot.step_id] = snapshot._replace(parameters=dict())
+            if len(self.__snapshot_by_id) > self.__archive_size:
+                del self.__snapshot_by_id[next(iter(self.__snapshot_by_id))]
+            b_thread_info = None
+        else:
+            b_thread_info = self.b_thread_info(snapshot)
+        for values in parameters.values():
+            values.pop("callback", None)
+        return {
+            "selected": snapshot.selected.name,
+            "b_thread_info": b_thread_info,
+            "parameters": parameters,
+            "datetime": snapshot.timestamp,
+            "id": snapshot.step_id,
+            "type": "trace",
+        }
+
+    def __sync_masks(self, snapshot: StepSnapshot) -> List[Tuple[int, int, int]]:
+        # the explicit events of the step are registered already, later events are masked out
+        known_mask = (1 << snapshot.registry_version) - 1
+        expand_mask = self.__event_set_expander.expand_mask
+        return [
+            (
+                expand_mask(sync.request) & known_mask,
+                expand_mask(sync.wait_for) & known_mask,
+                expand_mask(sync.block) & known_mask,
+            )
+            for sync in snapshot.sync_statements
+        ]
+
+    def __b_thread_info(self, snapshot: StepSnapshot, masks: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": sync.b_thread_name,
+                "priority": sync.priority,
+                "request": self.__describe_event_set(sync.request, request_mask, snapshot.registry_version),
+                "wait_for": self.__describe_event_set(sync.wait_for, wait_for_mask, snapshot.registry_version),
+                "block": self.__describe_event_set(sync.block, block_mask, snapshot.registry_version),
+            }
+            for sync, (request_mask, wait_for_mask, block_mask) in zip(snapshot.sync_statements, masks)
+        ]
+
+    def __describe_event_set(self, event_set: Any, mask: int, known: int) -> List[str] | Dict[str, Any]:
+        # open event sets stay symbolic in the trace, consumers expand them on demand via /events,
+        # explicit events are listed by name however many there are
+        set_name = self.__name_by_event_set.get(id(event_set))
+        if set_name is not None:
+            # steps expanded late only know fewer events of the set, the named mask only ever grows
+            named_mask = self.__mask_by_event_set_name.get(set_name, 0)
+            if set_name not in self.__mask_by_event_set_name or named_mask | mask != named_mask:
+                self.__mask_by_event_set_name[set_name] = named_mask | mask
+                self.__known_events_version += 1
+                self.__event_sets_version += 1
+            return {"symbol": "NAMED", "name": set_name, "known": known, "version": self.__event_sets_version}
+        if not _is_open(event_set):
+            return self.__event_registry.names(mask)
+        if isinstance(event_set, All):
+            return {"symbol": "ALL", "known": known}
+        full_mask = (1 << known) - 1
+        included = mask.bit_count()
+        if included > known - included:
+            return {"symbol": "ALL_EXCEPT", "known": known, "except": self.__event_registry.ids(full_mask & ~mask)}
+        return self.__event_registry.names(mask)
+
+
+class StepState(dict):
+    """Breakpoint view of a step snapshot.
+
+    The cheap keys are set right away, the masks and the b-thread infos are derived from the
+    snapshot on first access only, so steps without such breakpoints are never expanded here.
+    """
+
+    def __init__(self, snapshot: StepSnapshot, trace_builder: TraceBuilder) -> None:
+        super().__init__(
+            selected=snapshot.selected.name,
+            id=snapshot.step_id,
+            datetime=snapshot.timestamp,
+            event_registry=trace_builder.event_registry,
+        )
+        self.__snapshot = snapshot
+        self.__trace_builder = trace_builder
+
+    def __missing__(self, key: str) -> Any:
+        if key in ("requested_mask", "blocked_mask", "enabled_mask"):
+            requested_mask = 0
+            blocked_mask = 0
+            for request_mask, _, block_mask in self.__trace_builder.sync_masks(self.__snapshot):
+                requested_mask |= request_mask
+                blocked_mask |= block_mask
+            self["requested_mask"] = requested_mask
+            self["blocked_mask"] = blocked_mask
+            self["enabled_mask"] = requested_mask & ~blocked_mask
+        elif key == "b_thread_info":
+            self["b_thread_info"] = self.__trace_builder.b_thread_info(self.__snapshot)
+        else:
+            raise KeyError(key)
+        return self[key]
+
+
+class TracePipeline:
+    """Builds the trace frames of the captured steps on a worker thread and hands them to a sink.
+
+    The b-program thread only hands over snapshots, the expansion of the event sets and the
+    frame building happen on the worker. Info frames take the same queue, so the sink sees
+    all frames in the order of the b-program. The queue is bounded, a b-program that
+    outruns the worker waits for it instead of piling up snapshots. With a capture window,
+    only the snapshots the window lets pass are built at all.
+    """
+
+    def __init__(
+            self,
+            trace_builder: TraceBuilder,
+            sink: Callable[[Dict[str, Any]], None],
+            capacity: int,
+            capture_window: Optional[CaptureWindow] = None,
+    ) -> None:
+        self.__trace_builder = trace_builder
+        self.__sink = sink
+        self.__capture_window = capture_window
+        self.__build_durations = Histogram()
+        self.__queue: Queue[StepSnapshot | Dict[str, Any]] = Queue(maxsize=capacity)
+        self.__thread = Thread(target=self.__run, daemon=True)
+
+    @property
+    def build_durations(self) -> Histogram:
+        return self.__build_durations
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__queue.qsize()
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def submit(self, snapshot: StepSnapshot) -> None:
+        self.__queue.put(snapshot)
+
+    def submit_frame(self, frame: Dict[str, Any]) -> None:
+        self.__queue.put(frame)
+
+    def join(self) -> None:
+        # waits until every submitted frame reached the sink
+        self.__queue.join()
+
+    def __run(self) -> None:
+        while True:
+            item = self.__queue.get()
+            try:
+                items = [item]
+                if self.__capture_window is not None:
+                    items = self.__capture_window.admit(item, isinstance(item, StepSnapshot))
+                for item in items:
+                    if isinstance(item, StepSnapshot):
+                        start = time.perf_counter()
+                        item = self.__trace_builder.build_frame(item)
+                        self.__build_durations.observe(time.perf_counter() - start)
+                    self.__sink(item)
+            finally:
+                self.__queue.task_done()
@@ -0,0 +1,196 @@
+import struct
+from typing import Any, Dict, List, Tuple
+
+MAX_INTERNED_LENGTH = 64
+MAX_STRING_TABLE_SIZE = 1 << 16
+
+# MessagePack-like tags, strings are replaced by the string table definitions and references
+_NIL = 0xc0
+_FALSE = 0xc2
+_TRUE = 0xc3
+_STRING_REFERENCE_8 = 0xcc
+_STRING_REFERENCE_16 = 0xcd
+_STRING_DEFINITION = 0xd9
+_STRING_LITERAL = 0xdb
+_FLOAT_64 = 0xcb
+_INT_64 = 0xd3
+# ints beyond 64 bit, like JSON the format does not limit them
+_BIG_INT = 0xc7
+_FIX_MAP = 0x80
+_MAP_32 = 0xdf
+_FIX_ARRAY = 0x90
+_ARRAY_32 = 0xdd
+
+_length = struct.Struct(">I")
+_reference_16 = struct.Struct(">H")
+_float_64 = struct.Struct(">d")
+_int_64 = struct.Struct(">q")
+
+
+class BinaryEncoder:
+    """Encodes trace messages into a compact MessagePack-like format.
+
+    Every short string, e.g. an event name, a b-thread name or a key, is sent only once per
+    session: its first occurrence defines it under the next id of the session's string table,
+    every later occurrence refers to that id. Each message is prefixed by its length.
+    """
+
+    def __init__(self) -> None:
+        self.__string_ids: Dict[str, int] = dict()
+
+    def encode(self, message: Any) -> bytes:
+        buffer = bytearray()
+        self.__write(buffer, message)
+        return _length.pack(len(buffer)) + buffer
+
+    def __write(self, buffer: bytearray, value: Any) -> None:
+        value_type = type(value)
+        if value_type is str:
+            self.__write_string(buffer, value)
+        elif value_type is int:
+            if 0 <= value < 0x80:
+                buffer.append(value)
+            elif -32 <= value < 0:
+                buffer.append(value & 0xff)
+            elif -(1 << 63) <= value < (1 << 63):
+                buffer.append(_INT_64)
+                buffer += _int_64.pack(value)
+            else:
+                data = value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+                buffer.append(_BIG_INT)
+                buffer += _length.pack(len(data))
+                buffer += data
+        elif value_type is dict:
+            if len(value) < 16:
+                buffer.append(_FIX_MAP | len(value))
+            else:
+                buffer.append(_MAP_32)
+                buffer += _length.pack(len(value))
+            for key, item in value.items():
+                self.__write_string(buffer, key)
+                self.__write(buffer, item)
+        elif value_type is list or value_type is tuple:
+            if len(value) < 16:
+                buffer.append(_FIX_ARRAY | len(value))
+            else:
+                buffer.append(_ARRAY_32)
+                buffer += _length.pack(len(value))
+            for item in value:
+                self.__write(buffer, item)
+        elif value_type is float:
+            buffer.append(_FLOAT_64)
+            buffer += _float_64.pack(value)
+        elif value is None:
+            buffer.append(_NIL)
+        elif value is True:
+            buffer.append(_TRUE)
+        elif value is False:
+            buffer.append(_FALSE)
+        else:
+            raise TypeError(f"Object of type {value_type.__name__} can not be encoded")
+
+    def __write_string(self, buffer: bytearray, value: str) -> None:
+        string_id = self.__string_ids.get(value)
+        if string_id is not None:
+            if string_id < 0x100:
+                buffer.append(_STRING_REFERENCE_8)
+                buffer.append(string_id)
+            else:
+                buffer.append(_STRING_REFERENCE_16)
+                buffer += _reference_16.pack(string_id)
+            return
+        data = value.encode()
+        if len(data) <= MAX_INTERNED_LENGTH and len(self.__string_ids) < MAX_STRING_TABLE_SIZE:
+            self.__string_ids[value] = len(self.__string_ids)
+            buffer.append(_STRING_DEFINITION)
+            buffer.append(len(data))
+        else:
+            buffer.append(_STRING_LITERAL)
+            buffer += _length.pack(len(data))
+        buffer += data
+
+
+class BinaryDecoder:
+    """Decodes the length prefixed messages of a BinaryEncoder session from arbitrary chunks."""
+
+    def __init__(self) -> None:
+        self.__strings: List[str] = []
+        self.__pending = bytearray()
+
+    def feed(self, data: bytes) -> List[Any]:
+        self.__pending += data
+        messages = []
+        start = 0
+        while len(self.__pending) - start >= 4:
+            (length,) = _length.unpack_from(self.__pending, start)
+            end = start + 4 + length
+            if len(self.__pending) < end:
+                break
+            message, _ = self.__read(bytes(self.__pending[start + 4:end]), 0)
+            messages.append(message)
+            start = end
+        del self.__pending[:start]
+        return messages
+
+    def __read(self, data: bytes, position: int) -> Tuple[Any, int]:
+        # ordered by how often the tags occur in trace frames
+        tag = data[position]
+        position += 1
+        if tag == _STRING_REFERENCE_8:
+            return self.__strings[data[position]], position + 1
+        elif _FIX_MAP <= tag < _FIX_ARRAY or tag == _MAP_32:
+            if tag == _MAP_32:
+                size = _length.unpack_from(data, position)[0]
+                position += 4
+            else:
+                size = tag & 0x0f
+            result = dict()
+            strings = self.__strings
+            for _ in range(size):
+                # keys are always strings, most of the time already known ones
+                if data[position] == _STRING_REFERENCE_8:
+                    key = strings[data[position + 1]]
+                    position += 2
+                else:
+                    key, position = self.__read(data, position)
+                result[key], position = self.__read(data, position)
+            return result, position
+        elif tag < 0x80:
+            return tag, position
+        elif _FIX_ARRAY <= tag < _NIL or tag == _ARRAY_32:
+            if tag == _ARRAY_32:
+                size = _length.unpack_from(data, position)[0]
+                position += 4
+            else:
+                size = tag & 0x0f
+            result = []
+            for _ in range(size):
+                item, position = self.__read(data, position)
+                result.append(item)
+            return result, position
+        elif tag >= 0xe0:
+            return tag - 0x100, position
+        elif tag == _STRING_REFERENCE_16:
+            return self.__strings[_reference_16.unpack_from(data, position)[0]], position + 2
+        elif tag == _STRING_DEFINITION:
+            end = position + 1 + data[position]
+            value = data[position + 1:end].decode()
+            self.__strings.append(value)
+            return value, end
+        elif tag == _STRING_LITERAL:
+            end = position + 4 + _length.unpack_from(data, position)[0]
+            return data[position + 4:end].decode(), end
+        elif tag == _FLOAT_64:
+            return _float_64.unpack_from(data, position)[0], position + 8
+        elif tag == _INT_64:
+            return _int_64.unpack_from(data, position)[0], position + 8
+        elif tag == _BIG_INT:
+            end = position + 4 + _length.unpack_from(data, position)[0]
+            return int.from_bytes(data[position + 4:end], "big", signed=True), end
+        elif tag == _NIL:
+            return None, position
+        elif tag == _TRUE:
+            return True, position
+        elif tag == _FALSE:
+            return False, position
+        raise ValueError(f"Unknown tag {tag:#x}")
@@ -0,0 +1,94 @@
+from typing import Dict, Any, List
+
+DEFAULT_KEYFRAME_INTERVAL = 100
+
+
+class DeltaEncoder:
+    """Encodes a stream of trace frames as periodic keyframes and deltas in between.
+
+    A delta frame only carries the b-threads and parameters that changed since the previous
+    frame of the same stream, which is why every stream needs its own encoder. B-threads are
+    matched by their position in the frame, their names do not have to be unique.
+    """
+
+    def __init__(self, keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL) -> None:
+        self.__keyframe_interval = keyframe_interval
+        self.__frames_since_keyframe = keyframe_interval
+        self.__b_thread_info: List[Dict[str, Any]] = []
+        self.__parameters: Dict[str, Any] = dict()
+
+    def encode(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        if frame["type"] != "trace":
+            return frame
+        # frames of a lazy listener carry no b-thread infos, which leaves the b-threads of the stream untouched
+        b_thread_info = frame["b_thread_info"]
+        if b_thread_info is None:
+            b_thread_info = self.__b_thread_info
+        parameters = frame["parameters"]
+        if self.__frames_since_keyframe >= self.__keyframe_interval:
+            self.__frames_since_keyframe = 0
+            result = dict(frame, encoding="key")
+        else:
+            result = {
+                "type": "trace",
+                "encoding": "delta",
+                "id": frame["id"],
+                "selected": frame["selected"],
+                "datetime": frame["datetime"],
+                "b_thread_changes": [
+                    [position, info] for position, info in enumerate(b_thread_info)
+                    if position >= len(self.__b_thread_info) or self.__b_thread_info[position] != info
+                ],
+                "b_thread_count": len(b_thread_info),
+                "parameter_changes": {
+                    name: value for name, value in parameters.items() if self.__parameters.get(name) != value
+                },
+                "parameter_removals": [name for name in self.__parameters if name not in parameters],
+            }
+            if frame["b_thread_info"] is None:
+                result["b_thread_info"] = None
+        self.__frames_since_keyframe += 1
+        self.__b_thread_info = b_thread_info
+        self.__parameters = parameters
+        return result
+
+
+class DeltaDecoder:
+    """Reconstructs the full trace frames of a stream produced by a DeltaEncoder."""
+
+    def __init__(self) -> None:
+        self.__b_thread_info: List[Dict[str, Any]] = []
+        self.__parameters: Dict[str, Any] = dict()
+
+    def decode(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        encoding = frame.get("encoding")
+        if frame["type"] != "trace" or encoding is None:
+            return frame
+        if encoding == "key":
+            result = dict(frame)
+            result.pop("encoding")
+        else:
+            b_thread_info = self.__b_thread_info[:frame["b_thread_count"]]
+            for position, info in frame["b_thread_changes"]:
+                if position < len(b_thread_info):
+                    b_thread_info[position] = info
+                else:
+                    b_thread_info.append(info)
+            if "b_thread_info" in frame:
+                b_thread_info = None
+            parameters = dict(self.__parameters)
+            for name in frame["parameter_removals"]:
+                parameters.pop(name, None)
+            parameters.update(frame["parameter_changes"])
+            result = {
+                "selected": frame["selected"],
+                "b_thread_info": b_thread_info,
+                "parameters": parameters,
+                "datetime": frame["datetime"],
+                "id": frame["id"],
+                "type": "trace",
+            }
+        if result["b_thread_info"] is not None:
+            self.__b_thread_info = result["b_thread_info"]
+        self.__parameters = result["parameters"]
+        return result
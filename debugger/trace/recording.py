@@ -0,0 +1,125 @@
+import gzip
+import json
+import os
+import re
+import time
+import zlib
+from typing import Dict, Any, Iterator, IO, List, Optional
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_SEGMENT_NAME = re.compile(r"^segment-(\d{6})\.jsonl(\.gz)?$")
+
+
+def _segment_paths(directory: str) -> List[str]:
+    names = sorted(
+        (int(match.group(1)), name)
+        for name in os.listdir(directory)
+        if (match := _SEGMENT_NAME.match(name)) is not None
+    )
+    return [os.path.join(directory, name) for _, name in names]
+
+
+class RecordingWriter:
+    """Appends trace frames as JSON lines to the segment files of a recording directory.
+
+    A segment is closed as soon as it reaches the segment size and the next one is started,
+    existing segments are never written to again. Segments may be gzip compressed, in which
+    case the size refers to the compressed bytes, a segment exceeds it by about its last frame at most.
+    The open segment is
+    flushed at least every flush_interval seconds, so a running recording can be read up to then.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            segment_size: int = DEFAULT_SEGMENT_SIZE,
+            compress: bool = False,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ) -> None:
+        if segment_size < 1:
+            raise ValueError("The segment size of a recording has to be at least 1 byte")
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__segment_size = segment_size
+        self.__compress = compress
+        self.__flush_interval = flush_interval
+        self.__last_flush = time.monotonic()
+        # bytes given to the gzip stream since its last flush, their compressed size is not known yet
+        self.__unflushed = 0
+        existing = _segment_paths(directory)
+        self.__next_segment = 0
+        if existing:
+            self.__next_segment = int(_SEGMENT_NAME.match(os.path.basename(existing[-1])).group(1)) + 1
+        self.__file: Optional[IO[bytes]] = None
+        self.__stream: Optional[IO[bytes]] = None
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    def write(self, frame: Dict[str, Any]) -> None:
+        if self.__stream is None:
+            self.__open_segment()
+        data = json.dumps(frame).encode() + b"\n"
+        self.__stream.write(data)
+        if self.__compress:
+            self.__unflushed += len(data)
+            # compressed, the unflushed bytes take at most their own size, only then a flush is needed
+            if self.__file.tell() + self.__unflushed >= self.__segment_size:
+                self.flush()
+        if self.__file.tell() >= self.__segment_size:
+            self.close()
+        elif time.monotonic() - self.__last_flush >= self.__flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        # a gzip stream is sync flushed, everything written so far can be decompressed
+        if self.__stream is not None:
+            self.__stream.flush()
+        self.__unflushed = 0
+        self.__last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self.__stream is None:
+            return
+        self.__stream.close()
+        if self.__stream is not self.__file:
+            self.__file.close()
+        self.__stream = None
+        self.__file = None
+        self.__unflushed = 0
+
+    def __open_segment(self) -> None:
+        name = f"segment-{self.__next_segment:06d}.jsonl"
+        if self.__compress:
+            name += ".gz"
+        self.__next_segment += 1
+        # exclusive creation, a recording is never overwritten
+        self.__file = open(os.path.join(self.__directory, name), "xb")
+        if self.__compress:
+            self.__stream = gzip.GzipFile(fileobj=self.__file, mode="wb")
+        else:
+            self.__stream = self.__file
+
+
+def read_recording(directory: str) -> Iterator[Dict[str, Any]]:
+    """Yields all frames of a recording directory in the order they were written."""
+    for path in _segment_paths(directory):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as segment:
+            for line in _lines(segment):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of an interrupted recording may be incomplete
+                    break
+
+
+def _lines(segment: IO[bytes]) -> Iterator[bytes]:
+    try:
+        yield from segment
+    except (EOFError, zlib.error):
+        # a compressed segment that is still written or was cut off lacks its end of stream
+        return
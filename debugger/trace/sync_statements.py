@@ -0,0 +1,50 @@
+import hashlib
+import json
+from typing import Dict, Any, List, Tuple
+
+
+def sync_statement_id(sync_statement: Dict[str, Any]) -> str:
+    # equal sync statements get the same id, no matter in which trace or session they occur
+    data = json.dumps(sync_statement, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+class SyncStatementTable:
+    """Content addressed table of the b-thread sync statements of a trace.
+
+    Most b-threads repeat the same sync statement for many steps, so a trace frame only
+    references the statements of its b-threads by their content hash and every distinct
+    statement is stored once in the table.
+    """
+
+    def __init__(self) -> None:
+        self.__sync_statements: Dict[str, Dict[str, Any]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.__sync_statements)
+
+    def define(self, statement_id: str, sync_statement: Dict[str, Any]) -> None:
+        self.__sync_statements[statement_id] = sync_statement
+
+    def deduplicate(self, frame: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        # returns the frame referencing its sync statements and the statements that were new to the table
+        if frame.get("b_thread_info") is None:
+            return frame, dict()
+        statement_ids: List[str] = []
+        definitions = dict()
+        for sync_statement in frame["b_thread_info"]:
+            statement_id = sync_statement_id(sync_statement)
+            if statement_id not in self.__sync_statements:
+                self.__sync_statements[statement_id] = sync_statement
+                definitions[statement_id] = sync_statement
+            statement_ids.append(statement_id)
+        result = dict(frame, sync_statement_ids=statement_ids)
+        result.pop("b_thread_info")
+        return result, definitions
+
+    def rehydrate(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        if "sync_statement_ids" not in frame:
+            return frame
+        result = dict(frame)
+        result["b_thread_info"] = [dict(self.__sync_statements[i]) for i in result.pop("sync_statement_ids")]
+        return result
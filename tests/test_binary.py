@@ -0,0 +1,8 @@
+from debugger.trace.binary import BinaryEncoder, BinaryDecoder
+
+
+def test_ints_beyond_64_bit_round_trip():
+    values = [2 ** 63 - 1, -2 ** 63, 2 ** 63, -2 ** 63 - 1, 10 ** 40, -10 ** 40, {"Level": {"value": 2 ** 64}}]
+    encoder = BinaryEncoder()
+    data = b"".join(encoder.encode(value) for value in values)
+    assert BinaryDecoder().feed(data) == values
@@ -0,0 +1,149 @@
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from bppy import BEvent
+
+from debugger.server.break_point import Breakpoint, BreakpointRepository, DifferenceBreakpoint
+from debugger.server.event_registry import EventRegistry
+
+
+def _breakpoint(b_id: str, *selected: str) -> Breakpoint:
+    return Breakpoint.from_json(
+        {"id": b_id, "chain": [{"name": "EVENT_SELECTED", "value": event} for event in selected]}
+    )
+
+
+def _state(step_id: int, selected: str, requested: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    registry = EventRegistry()
+    requested_mask = 0
+    for name in requested:
+        requested_mask |= 1 << registry.intern(BEvent(name))
+    return {
+        "selected": selected,
+        "id": step_id,
+        "requested_mask": requested_mask,
+        "blocked_mask": 0,
+        "event_registry": registry,
+    }
+
+
+def _run(repository: BreakpointRepository, selected: str, first_id: int = 0) -> List[Tuple[str, ...]]:
+    fired = []
+    for step_id, event in enumerate(selected, first_id):
+        repository.advance_break_points(_state(step_id, event))
+        fired.append(tuple(sorted(repository.which())))
+    return fired
+
+
+def test_overlapping_match_after_repeated_prefix():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("aab", "A", "A", "B"))
+    assert _run(repository, "AAAB") == [(), (), (), ("aab",)]
+
+
+def test_repeated_chain_fires_on_every_overlapping_match():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("aa", "A", "A"))
+    assert _run(repository, "AAA") == [(), ("aa",), ("aa",)]
+
+
+def test_chain_overlapping_with_itself():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("aba", "A", "B", "A"))
+    assert _run(repository, "ABABA") == [(), (), ("aba",), (), ("aba",)]
+
+
+def test_chains_sharing_a_prefix():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("a", "A"))
+    repository.add_breakpoint(_breakpoint("ab", "A", "B"))
+    repository.add_breakpoint(_breakpoint("abc", "A", "B", "C"))
+    repository.add_breakpoint(_breakpoint("abd", "A", "B", "D"))
+    assert _run(repository, "ABCABD") == [("a",), ("ab",), ("abc",), ("a",), ("ab",), ("abd",)]
+
+
+def test_mismatch_resets_a_partial_match():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("ab", "A", "B"))
+    assert _run(repository, "ACB") == [(), (), ()]
+
+
+def test_delete_keeps_the_shared_prefix_of_other_chains():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("ab", "A", "B"))
+    repository.add_breakpoint(_breakpoint("ac", "A", "C"))
+    repository.delete_breakpoint("ab")
+    assert len(repository) == 1
+    assert _run(repository, "ABAC") == [(), (), (), ("ac",)]
+
+
+def test_delete_prunes_partial_matches():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("ab", "A", "B"))
+    assert _run(repository, "A") == [()]
+    repository.delete_breakpoint("ab")
+    repository.add_breakpoint(_breakpoint("ab", "A", "B"))
+    # the partial match of the deleted chain does not carry over to the new one
+    assert _run(repository, "BAB", 1) == [(), (), ("ab",)]
+
+
+def test_pause_prunes_partial_matches_and_unpause_restores_the_chain():
+    repository = BreakpointRepository()
+    repository.add_breakpoints([_breakpoint("ab", "A", "B"), _breakpoint("b", "B")])
+    assert _run(repository, "A") == [()]
+    repository.pause_breakpoints(["ab"])
+    assert _run(repository, "B", 1) == [("b",)]
+    repository.unpause_breakpoints(["ab"])
+    assert _run(repository, "BAB", 2) == [("b",), (), ("ab", "b")]
+
+
+def test_fired_breakpoint_is_forgotten_on_delete():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("a", "A"))
+    assert repository.advance_break_points(_state(0, "A"))
+    repository.delete_breakpoint("a")
+    assert repository.which() == ()
+
+
+def test_bulk_add_is_all_or_nothing():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(_breakpoint("a", "A"))
+    with pytest.raises(KeyError):
+        repository.add_breakpoints([_breakpoint("b", "B"), _breakpoint("a", "C")])
+    assert len(repository) == 1
+
+
+def test_requested_events_are_dispatched():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(
+        Breakpoint.from_json({"id": "r", "chain": [{"name": "EVENT_REQUESTED", "value": "DRAIN"}]})
+    )
+    repository.advance_break_points(_state(0, "A", ("FILL",)))
+    assert repository.which() == ()
+    repository.advance_break_points(_state(1, "A", ("FILL", "DRAIN")))
+    assert repository.which() == ("r",)
+
+
+def test_difference_breakpoint_fires_on_the_first_difference():
+    repository = BreakpointRepository()
+    repository.add_breakpoint(
+        DifferenceBreakpoint.from_json(
+            {
+                "id": "0",
+                "current_position": 0,
+                "chain": [{"name": "EVENT_SELECTED", "value": event} for event in "AB"],
+            }
+        )
+    )
+    assert _run(repository, "AC") == [(), ("0",)]
+
+
+def test_paused_breakpoints_do_not_count_as_active():
+    repository = BreakpointRepository()
+    repository.add_breakpoints([_breakpoint("a", "A"), _breakpoint("b", "B")], {"b"})
+    assert len(repository) == 1
+    assert _run(repository, "B") == [()]
+    repository.pause_breakpoints(["a"])
+    assert not repository
+    repository.unpause_breakpoints(["b"])
+    assert _run(repository, "B", 1) == [("b",)]
@@ -0,0 +1,35 @@
+from collections import namedtuple
+
+from debugger.server.capture_window import CaptureWindow
+
+_Step = namedtuple("_Step", "step_id")
+
+
+def _run(capture_window, step_count, firing_ids):
+    passed = []
+    for step_id in range(step_count):
+        passed += capture_window.admit(_Step(step_id), True)
+        if step_id in firing_ids:
+            passed += capture_window.admit(CaptureWindow.trigger_frame(step_id, ["b"]), False)
+    return [item.step_id if isinstance(item, _Step) else ("trigger", item["id"]) for item in passed]
+
+
+def test_post_trigger_only_window_keeps_the_firing_step():
+    assert _run(CaptureWindow(0, 2), 20, {4, 14}) == [4, ("trigger", 4), 5, 6, 14, ("trigger", 14), 15, 16]
+
+
+def test_pre_trigger_only_window_keeps_the_firing_step():
+    assert _run(CaptureWindow(2, 0), 20, {9}) == [7, 8, 9, ("trigger", 9)]
+
+
+def test_overlapping_triggers_extend_the_window():
+    assert _run(CaptureWindow(1, 2), 20, {5, 6, 10}) == [
+        4, 5, ("trigger", 5), 6, ("trigger", 6), 7, 8, 9, 10, ("trigger", 10), 11, 12
+    ]
+
+
+def test_frames_other_than_steps_always_pass():
+    capture_window = CaptureWindow(1, 1)
+    info = {"type": "info", "paused": False}
+    assert capture_window.admit(_Step(0), True) == []
+    assert capture_window.admit(info, False) == [info]
@@ -0,0 +1,58 @@
+from debugger.trace.delta import DeltaEncoder, DeltaDecoder
+
+
+def _info(name, request):
+    return {"name": name, "priority": 0, "request": request, "wait_for": [], "block": []}
+
+
+def _frame(state_id, b_thread_info, parameters=None):
+    return {
+        "selected": "A",
+        "b_thread_info": b_thread_info,
+        "parameters": parameters if parameters is not None else {},
+        "datetime": 0.0,
+        "id": state_id,
+        "type": "trace",
+    }
+
+
+def _round_trip(frames, keyframe_interval=100):
+    encoder = DeltaEncoder(keyframe_interval)
+    decoder = DeltaDecoder()
+    return [decoder.decode(encoder.encode(frame)) for frame in frames]
+
+
+def test_b_threads_with_the_same_name_are_kept_apart():
+    frames = [
+        _frame(0, [_info("bt", ["A"]), _info("bt", ["B"])]),
+        _frame(1, [_info("bt", ["A"]), _info("bt", ["C"])]),
+        _frame(2, [_info("bt", ["C"]), _info("bt", ["C"])]),
+    ]
+    assert _round_trip(frames) == frames
+
+
+def test_b_threads_added_and_removed_keep_their_order():
+    frames = [
+        _frame(0, [_info("first", ["A"]), _info("second", ["B"])]),
+        _frame(1, [_info("new", ["C"]), _info("first", ["A"]), _info("second", ["B"])]),
+        _frame(2, [_info("new", ["C"]), _info("second", ["B"])]),
+        _frame(3, [_info("new", ["C"]), _info("second", ["B"]), _info("bt", ["A"]), _info("bt", ["A"])]),
+        _frame(4, []),
+    ]
+    assert _round_trip(frames) == frames
+    assert _round_trip(frames, keyframe_interval=2) == frames
+
+
+def test_parameters_and_lazy_frames_round_trip():
+    b_thread_info = [_info("bt", ["A"])]
+    frames = [
+        _frame(0, b_thread_info, {"x": {"value": 1}, "y": {"value": 2}}),
+        _frame(1, None, {"x": {"value": 3}}),
+        _frame(2, b_thread_info, {"x": {"value": 3}, "z": {"value": 4}}),
+    ]
+    assert _round_trip(frames) == frames
+
+
+def test_frames_other_than_traces_pass_unchanged():
+    info = {"type": "info", "paused": True, "ended": False}
+    assert _round_trip([info]) == [info]
@@ -0,0 +1,47 @@
+import json
+import os
+import random
+
+import pytest
+
+from debugger.trace.recording import RecordingWriter, read_recording
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_an_open_segment_is_readable_after_a_flush(tmp_path, compress):
+    writer = RecordingWriter(str(tmp_path), compress=compress, flush_interval=0)
+    for step_id in range(3):
+        writer.write({"type": "trace", "id": step_id})
+
+    assert [frame["id"] for frame in read_recording(str(tmp_path))] == [0, 1, 2]
+    writer.close()
+
+
+def test_a_cut_off_compressed_segment_keeps_its_decoded_frames(tmp_path):
+    writer = RecordingWriter(str(tmp_path), compress=True, flush_interval=0)
+    writer.write({"type": "trace", "id": 0})
+    writer.write({"type": "trace", "id": 1})
+    path = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    with open(path, "ab") as segment:
+        # a partially written deflate block
+        segment.write(b"\x05\xc0\x81")
+
+    assert [frame["id"] for frame in read_recording(str(tmp_path))] == [0, 1]
+    writer.close()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_segments_are_rotated_at_their_size(tmp_path, compress):
+    random.seed(0)
+    writer = RecordingWriter(str(tmp_path), segment_size=4096, compress=compress)
+    frames = [{"type": "trace", "id": step_id, "noise": random.getrandbits(256)} for step_id in range(2000)]
+    for frame in frames:
+        writer.write(frame)
+    writer.close()
+
+    largest_frame = max(len(json.dumps(frame)) + 1 for frame in frames)
+    sizes = [os.path.getsize(os.path.join(str(tmp_path), name)) for name in os.listdir(str(tmp_path))]
+    assert len(sizes) > 1
+    # gzip adds its trailer on close
+    assert max(sizes) <= 4096 + largest_frame + 16
+    assert list(read_recording(str(tmp_path))) == frames
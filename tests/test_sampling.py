@@ -0,0 +1,56 @@
+import pytest
+from bppy import BEvent
+
+from debugger.server.sampling import Sampler, SamplingPolicy
+from debugger.server.trace_pipeline import StepSnapshot
+
+
+def _snapshot(step_id, selected="A", parameters=None):
+    return StepSnapshot(step_id, BEvent(selected), 0.0, (), parameters or {}, 0)
+
+
+def _sampled_ids(sampler, snapshots):
+    return [snapshot.step_id for snapshot in snapshots if sampler.sample(snapshot)]
+
+
+def test_all_steps_are_sampled_by_default():
+    sampler = Sampler()
+    assert _sampled_ids(sampler, [_snapshot(i) for i in range(3)]) == [0, 1, 2]
+    assert sampler.sampled_out == 0
+
+
+def test_every_nth_step_is_sampled():
+    sampler = Sampler(SamplingPolicy.EVERY_NTH, 3)
+    assert _sampled_ids(sampler, [_snapshot(i) for i in range(8)]) == [0, 3, 6]
+    assert sampler.sampled_out == 5
+
+
+def test_max_rate_limits_the_sampled_steps(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("debugger.server.sampling.time.monotonic", lambda: now[0])
+    sampler = Sampler(SamplingPolicy.MAX_RATE, 2)
+    sampled = []
+    for step_id in range(6):
+        if sampler.sample(_snapshot(step_id)):
+            sampled.append(step_id)
+        now[0] += 0.2
+    # at most one step per half second
+    assert sampled == [0, 3]
+
+
+def test_on_change_samples_only_changed_steps():
+    sampler = Sampler(SamplingPolicy.ON_CHANGE)
+    snapshots = [
+        _snapshot(0, "A", {"x": {"value": 1}}),
+        _snapshot(1, "A", {"x": {"value": 1, "editable": True}}),
+        _snapshot(2, "B", {"x": {"value": 1}}),
+        _snapshot(3, "B", {"x": {"value": 2}}),
+        _snapshot(4, "B", {"x": {"value": 2}}),
+    ]
+    assert _sampled_ids(sampler, snapshots) == [0, 2, 3]
+
+
+@pytest.mark.parametrize("policy", [SamplingPolicy.EVERY_NTH, SamplingPolicy.MAX_RATE])
+def test_rate_policies_need_a_positive_n(policy):
+    with pytest.raises(ValueError):
+        Sampler(policy, 0)
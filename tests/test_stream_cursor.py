@@ -0,0 +1,23 @@
+from debugger.client.backend.client import _StreamCursor
+from debugger.client.backend.trace_store import ColumnarTraceStore
+
+
+def _state(state_id):
+    return {"selected": "A", "b_thread_info": [], "parameters": {}, "datetime": 0.0, "id": state_id, "type": "trace"}
+
+
+def test_cursor_reads_the_store_as_it_grows():
+    trace_store = ColumnarTraceStore()
+    info = {"type": "info", "paused": True, "ended": False}
+    latest_info = [(0, -1, None)]
+    cursor = _StreamCursor(trace_store, lambda: latest_info[0])
+    for state_id in range(3):
+        trace_store.append(state_id, _state(state_id))
+    latest_info[0] = (1, 1, info)
+    trace_store.append(3, _state(3))
+
+    # the info frame is delivered after the states it follows, no frame is delivered twice
+    assert [frame.get("id", frame["type"]) for frame in cursor.pending()] == [0, 1, "info", 2, 3]
+    assert list(cursor.pending()) == []
+    trace_store.append(4, _state(4))
+    assert [frame["id"] for frame in cursor.pending()] == [4]
@@ -0,0 +1,37 @@
+import pytest
+
+from debugger.server.trace_buffer import TraceBuffer, OverflowPolicy
+
+
+def _read_all(subscription):
+    frames = []
+    frame = subscription.poll()
+    while frame is not None:
+        frames.append(frame)
+        frame = subscription.poll()
+    return frames
+
+
+@pytest.mark.parametrize("policy", [OverflowPolicy.COALESCE, OverflowPolicy.DROP_OLDEST])
+def test_evicted_control_frames_are_delivered(policy):
+    trace_buffer = TraceBuffer(3, policy)
+    subscription = trace_buffer.subscribe()
+    trace_buffer.put({"type": "info", "paused": True, "ended": False})
+    trace_buffer.put({"type": "trigger", "id": 0, "breakpoint_ids": ["b"]})
+    for step_id in range(5):
+        trace_buffer.put({"type": "trace", "id": step_id})
+    trace_buffer.put({"type": "info", "paused": True, "ended": True})
+    for step_id in range(5, 8):
+        trace_buffer.put({"type": "trace", "id": step_id})
+
+    frames = _read_all(subscription)
+    if policy == OverflowPolicy.COALESCE:
+        assert frames.pop(0) == {"type": "gap", "count": 5, "first_id": 0, "last_id": 4}
+    # only the latest info frame is kept, it supersedes the earlier one
+    assert frames == [
+        {"type": "trigger", "id": 0, "breakpoint_ids": ["b"]},
+        {"type": "info", "paused": True, "ended": True},
+        {"type": "trace", "id": 5},
+        {"type": "trace", "id": 6},
+        {"type": "trace", "id": 7},
+    ]
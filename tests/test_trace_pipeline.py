@@ -0,0 +1,66 @@
+from bppy import BEvent, All, AllExcept, EmptyEventSet, EventSet, EventSetList
+
+from debugger.server.trace_pipeline import TraceBuilder, StepSnapshot, SyncSnapshot, StepState
+from debugger.client.backend.client import _expand_event_set
+
+
+def _capture(trace_builder, step_id, selected, request):
+    sync_statements = (SyncSnapshot("bt", 0, request, EmptyEventSet(), EmptyEventSet()),)
+    registry_version = trace_builder.register_step(selected, sync_statements)
+    return StepSnapshot(step_id, selected, 0.0, sync_statements, dict(), registry_version)
+
+
+def test_steps_expand_against_their_registry_version():
+    trace_builder = TraceBuilder()
+    first = _capture(trace_builder, 0, BEvent("A"), All())
+    second = _capture(trace_builder, 1, BEvent("B"), [BEvent("A"), BEvent("B")])
+
+    # the first step is expanded only after B became known, All still means A alone there
+    assert StepState(first, trace_builder)["requested_mask"] == 0b1
+    assert trace_builder.b_thread_info(first)[0]["request"] == {"symbol": "ALL", "known": 1}
+    assert StepState(second, trace_builder)["requested_mask"] == 0b11
+
+
+def test_archive_keeps_the_latest_steps_only():
+    trace_builder = TraceBuilder(lazy=True, archive_size=2)
+    for step_id in range(3):
+        trace_builder.build_frame(_capture(trace_builder, step_id, BEvent("A"), [BEvent("A")]))
+
+    assert trace_builder.archived_b_thread_info(0) is None
+    assert trace_builder.archived_b_thread_info(2)[0]["request"] == ["A"]
+
+
+def test_only_open_event_sets_are_symbolic():
+    trace_builder = TraceBuilder()
+    events = [BEvent("A"), BEvent("B"), BEvent("C")]
+    _capture(trace_builder, 0, events[0], events)
+
+    def describe(event_set):
+        return trace_builder.b_thread_info(_capture(trace_builder, 1, events[0], event_set))[0]["request"]
+
+    assert describe(events) == ["A", "B", "C"]
+    assert describe(EventSetList(events)) == ["A", "B", "C"]
+    assert describe(All()) == {"symbol": "ALL", "known": 3}
+    assert describe(AllExcept(events[1])) == {"symbol": "ALL_EXCEPT", "known": 3, "except": [1]}
+    assert describe(EventSet(lambda event: event.name == "A")) == ["A"]
+
+
+def test_a_named_set_is_refetched_once_it_grew():
+    trace_builder = TraceBuilder()
+    evens = EventSet(lambda event: int(event.name[1:]) % 2 == 0)
+    trace_builder.mark_event_set("Evens", evens)
+    first = trace_builder.b_thread_info(_capture(trace_builder, 0, BEvent("E0"), evens))[0]["request"]
+    known_events = trace_builder.known_events()
+    cached = (known_events["events"], known_events["event_sets"], known_events["event_sets_version"])
+    assert _expand_event_set(first, *cached) == ["E0"]
+
+    events = [BEvent(f"E{i}") for i in range(10)]
+    _capture(trace_builder, 1, BEvent("E1"), events)
+    named = trace_builder.b_thread_info(_capture(trace_builder, 2, BEvent("E1"), evens))[0]["request"]
+    # the cached event sets are outdated, although they cover all events up to known
+    stale_events = [event.name for event in events]
+    assert _expand_event_set(named, stale_events, *cached[1:]) is None
+    known_events = trace_builder.known_events()
+    assert _expand_event_set(
+        named, known_events["events"], known_events["event_sets"], known_events["event_sets_version"]
+    ) == ["E0", "E2", "E4", "E6", "E8"]
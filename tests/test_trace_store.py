@@ -0,0 +1,66 @@
+import pytest
+
+from debugger.client.backend.trace_store import MappedTraceStore, ColumnarTraceStore
+
+
+def _state(state_id, selected="A", b_thread_info=None):
+    return {
+        "selected": selected,
+        "b_thread_info": [] if b_thread_info is None else b_thread_info,
+        "parameters": {"x": {"value": state_id, "editable": False}},
+        "datetime": float(state_id),
+        "id": state_id,
+        "type": "trace",
+    }
+
+
+@pytest.fixture(params=[MappedTraceStore, ColumnarTraceStore])
+def trace_store(request):
+    trace_store = request.param()
+    yield trace_store
+    trace_store.close()
+
+
+def test_states_round_trip(trace_store):
+    info = [{"name": "bt", "priority": 0, "request": ["A"], "wait_for": [], "block": ["B"]}]
+    for state_id in range(3):
+        trace_store.append(state_id, _state(state_id, b_thread_info=info))
+
+    assert len(trace_store) == 3
+    assert trace_store.last_id == 2
+    assert trace_store.get(1) == _state(1, b_thread_info=info)
+    assert trace_store.get(3) is None
+    assert 2 in trace_store and 5 not in trace_store
+
+
+def test_sparse_ids_are_iterated_in_order(trace_store):
+    for state_id in (0, 1000000, 2000000):
+        trace_store.append(state_id, _state(state_id))
+
+    assert [state_id for state_id, _ in trace_store.items()] == [0, 1000000, 2000000]
+    assert [state["id"] for _, state in trace_store.items(1)] == [1000000, 2000000]
+
+
+def test_iteration_includes_states_appended_meanwhile(trace_store):
+    trace_store.append(0, _state(0))
+    items = trace_store.items()
+    assert next(items)[0] == 0
+    trace_store.append(1, _state(1))
+    assert [state_id for state_id, _ in items] == [1]
+
+
+def test_unexpanded_b_thread_info_is_kept_as_none(trace_store):
+    state = dict(_state(0), b_thread_info=None)
+    trace_store.append(0, state)
+
+    assert trace_store.get(0)["b_thread_info"] is None
+
+
+def test_columnar_store_keeps_explicit_events_as_masks():
+    trace_store = ColumnarTraceStore()
+    symbolic = {"symbol": "ALL", "known": 3}
+    info = [{"name": "bt", "priority": 0, "request": ["B", "C"], "wait_for": symbolic, "block": []}]
+    trace_store.append(0, _state(0, selected="A", b_thread_info=info))
+
+    assert trace_store.get(0)["b_thread_info"] == info
+    assert trace_store.event_names == ["A", "B", "C"]